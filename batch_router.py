@@ -0,0 +1,134 @@
+import numpy as np
+
+from graph import get_departures
+from parsing import parse_duration
+from records import Link
+
+class CSRNetwork:
+	"""
+	array backed copy of a sub graph for one to all searches
+	links are grouped by start node in compressed sparse row layout, link i of node u sits at indptr[u] <= i < indptr[u + 1]
+	times are seconds from the network's earliest departure, recurring links carry their period in seconds, 0 when one off
+	"""
+
+	def __init__(self, g):
+		self.g = g
+		self.nodes = list(g.nodes)
+		self.index = {node: i for i, node in enumerate(self.nodes)}
+		links = sorted(
+			((self.index[from_node], self.index[to_node], from_node, to_node, key, data['attr_dict'])
+			for from_node, to_node, key, data in g.edges(keys=True, data=True)),
+			key=lambda x: x[0]
+		)
+		self.epoch = min((link[5]['startDate'] for link in links), default=None)
+		self.keys = [link[2:5] for link in links]
+		self.periods = [parse_duration(link[5]['recurrence']) if link[5].get('recurrence') else None for link in links]
+
+		self.src = np.array([link[0] for link in links], dtype=np.int64)
+		self.dst = np.array([link[1] for link in links], dtype=np.int64)
+		self.indptr = np.searchsorted(self.src, np.arange(len(self.nodes) + 1))
+		self.start = np.array([self.seconds(link[5]['startDate']) for link in links], dtype=np.float64)
+		self.end = np.array([self.seconds(link[5]['endDate']) for link in links], dtype=np.float64)
+		self.cost = np.array([link[5]['cost'] for link in links], dtype=np.float64)
+		self.period = np.array([period.total_seconds() if period else 0 for period in self.periods], dtype=np.float64)
+
+	def seconds(self, date):
+		return (date - self.epoch).total_seconds()
+
+	def link(self, i, n):
+		# nth departure of link i as a Link record, sharing the departure index's link data
+		from_node, to_node, key = self.keys[i]
+		if self.periods[i] is None:
+			data = self.g[from_node][to_node][key]['attr_dict']
+		else:
+			data = get_departures(self.g, from_node, to_node).occurrence(key, self.periods[i], n)
+		return Link(from_node, self.g.nodes[from_node].get('label', 'COVERAGEAREA'), to_node, self.g.nodes[to_node]['label'], data)
+
+def get_network(g):
+	# the array copy is built on first use and kept on the graph, which is not modified once filtered
+	network = g.graph.get('csr')
+	if network is None:
+		network = CSRNetwork(g)
+		g.graph['csr'] = network
+	return network
+
+def search_all(network, origin, start_time):
+	'''
+	one to all earliest arrival search over the departures of a CSRNetwork
+	label correcting in rounds: each round relaxes every link leaving the nodes whose arrival improved in the last round,
+	as one set of array operations, until no arrival improves
+	a link can only be taken if it departs strictly after the order arrives at its start node, ties go to the cheaper link
+	:return: (arrival seconds per node, inf when unreachable, link taken into each node, its departure number)
+	'''
+
+	n_nodes = len(network.nodes)
+	arrival = np.full(n_nodes, np.inf)
+	previous = np.full(n_nodes, -1, dtype=np.int64)
+	occurrence = np.zeros(n_nodes, dtype=np.int64)
+	origin = network.index[origin]
+	arrival[origin] = network.seconds(start_time)
+
+	frontier = np.array([origin], dtype=np.int64)
+	while frontier.size:
+		starts = network.indptr[frontier]
+		counts = network.indptr[frontier + 1] - starts
+		total = counts.sum()
+		if not total:
+			break
+		offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+		links = np.arange(total) + offsets
+		ready = np.repeat(arrival[frontier], counts)
+
+		start = network.start[links]
+		period = network.period[links]
+		recurring = (period > 0) & (ready >= start)
+		n = np.zeros(total, dtype=np.int64)
+		n[recurring] = np.floor((ready[recurring] - start[recurring]) / period[recurring]).astype(np.int64) + 1
+		departs = start + n * period
+		arrives = network.end[links] + n * period
+
+		valid = departs > ready
+		links, n, arrives = links[valid], n[valid], arrives[valid]
+		if not links.size:
+			break
+		to_nodes = network.dst[links]
+
+		# best link into every node reached this round, earliest arrival first then cheapest
+		order = np.lexsort((network.cost[links], arrives, to_nodes))
+		to_nodes, links, n, arrives = to_nodes[order], links[order], n[order], arrives[order]
+		first = np.flatnonzero(np.r_[True, to_nodes[1:] != to_nodes[:-1]])
+		to_nodes, links, n, arrives = to_nodes[first], links[first], n[first], arrives[first]
+
+		improved = arrives < arrival[to_nodes]
+		to_nodes = to_nodes[improved]
+		arrival[to_nodes] = arrives[improved]
+		previous[to_nodes] = links[improved]
+		occurrence[to_nodes] = n[improved]
+		frontier = to_nodes
+
+	return arrival, previous, occurrence
+
+def route_batch(g, origin, start_time, destinations):
+	'''
+	routes every order of a batch leaving origin at start_time with a single one to all search
+	:return: {destination: links from the destination back to the origin} for every destination reached
+	'''
+
+	network = get_network(g)
+	if origin not in network.index or not network.keys:
+		return {}
+	arrival, previous, occurrence = search_all(network, origin, start_time)
+	origin = network.index[origin]
+
+	routes = {}
+	for destination in destinations:
+		node = network.index.get(destination)
+		if node is None or node == origin or np.isinf(arrival[node]):
+			continue
+		links = []
+		while node != origin:
+			i = previous[node]
+			links.append(network.link(i, int(occurrence[node])))
+			node = int(network.src[i])
+		routes[destination] = links
+	return routes
@@ -0,0 +1,383 @@
+import argparse
+import csv
+import io
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+import networkx as nx
+
+from parsing import parse_timestamps
+from batch_router import route_batch
+from graph import calculate_financial_cost, calculate_time_cost, find_path, find_heuristic_cost, path_cost
+from memory_handler import MemoryHandler
+from simulator import Simulator
+from snapshot import SnapshotHandler, compile_snapshot, read_workbook, snapshot_path
+from synthetic import generate_orders, generate_schedule, write_graph, write_orders
+from records import Event, Link
+from timeline import Timeline
+
+def generate_network(n_nodes, n_links, days=1, seed=0):
+	# loads a synthetic schedule into a graph shaped like the filtered sub graphs
+	nodes, links, origins, destinations = generate_schedule(n_nodes, n_links, days, seed)
+	return schedule_to_networkx(nodes, links), origins, destinations
+
+def schedule_to_networkx(nodes, links):
+	g = nx.MultiDiGraph()
+	for node in nodes:
+		g.add_node(node['name'], label=node['label'], **node['properties'])
+	for link in links:
+		g.add_edge(link['node1'], link['node2'], attr_dict=dict(link['properties']))
+	return g
+
+def legacy_find_path(g, order_details, cost_factor):
+	# the list based search find_path replaced, kept as the baseline
+	# dead ends are skipped instead of raising so both searches answer the same queries
+	opened = []
+	closed = []
+
+	start_time = order_details['created_on']
+	end_node = order_details['destination_zone']
+	start_node = order_details['origin_zone']
+	current_node = start_node
+	opened.append(current_node)
+	table = {start_node: {'cost_to_start': 0, 'f_value': 0, 'prev_node': None, 'link_id': None, 'end_date': start_time}}
+
+	while current_node != end_node:
+		for nbr, links in g[current_node].items():
+			if nbr not in opened and nbr not in closed:
+				link_id = min(
+					(link for link, val in links.items() if val['attr_dict']['startDate'] > start_time),
+					key=lambda x: links[x]['attr_dict']['startDate'],
+					default=None
+				)
+				if link_id is None:
+					continue
+				opened.append(nbr)
+				link_data = links[link_id]['attr_dict']
+				if cost_factor == 'cost':
+					cost = calculate_financial_cost(link_data)
+				else:
+					cost = calculate_time_cost(link_data, start_time)
+				cost_to_start = table[current_node]['cost_to_start'] + cost
+				if not table.get(nbr) or table[nbr]['f_value'] > cost_to_start:
+					table[nbr] = {
+						'cost_to_start': cost_to_start,
+						'f_value': cost_to_start,
+						'prev_node': current_node,
+						'link_id': link_id,
+						'end_date': link_data['endDate']
+					}
+		opened.remove(current_node)
+		if current_node not in closed:
+			closed.append(current_node)
+		if not opened:
+			return None
+		current_node = max((key for key in table.keys() if key in opened), key=lambda x: table[x]['f_value'])
+		start_time = table[current_node]['end_date']
+
+	return table[end_node]['cost_to_start']
+
+def benchmark_find_path(sizes, queries, days, cost_factor, seed):
+	print(f'{"nodes":>8} {"links":>8} {"search":>10} {"found":>6} {"ms/query":>10} {"avg cost":>10}')
+	for n_nodes, n_links in sizes:
+		g, origins, destinations = generate_network(n_nodes, n_links, days, seed)
+		rng = random.Random(seed)
+		created_on = datetime(2019, 8, 23, tzinfo=timezone.utc)
+		orders = [
+			{'origin_zone': rng.choice(origins), 'destination_zone': rng.choice(destinations), 'created_on': created_on}
+			for _ in range(queries)
+		]
+
+		def run_legacy(order):
+			return legacy_find_path(g, order, cost_factor)
+
+		def run_dijkstra(order):
+			return find_path(g, order, cost_factor)[1]
+
+		def run_astar(order):
+			heuristic = find_heuristic_cost(g, order['destination_zone'], cost_factor)
+			return find_path(g, order, cost_factor, heuristic)[1]
+
+		for name, search in [('legacy', run_legacy), ('dijkstra', run_dijkstra), ('astar', run_astar)]:
+			start = time.perf_counter()
+			costs = [search(order) for order in orders]
+			elapsed = time.perf_counter() - start
+			found = [cost for cost in costs if cost is not None]
+			avg_cost = sum(found) / len(found) if found else 0
+			print(
+				f'{n_nodes:>8} {g.number_of_edges():>8} {name:>10} {len(found):>6} '
+				f'{elapsed * 1000 / queries:>10.3f} {avg_cost:>10.2f}'
+			)
+
+def benchmark_timestamps(orders_file, repeat):
+	with open(f'{orders_file}.csv') as orders:
+		reader = csv.reader(orders)
+		column = [header.lower().replace(' ', '_') for header in next(reader)].index('created_on')
+		values = [row[column] for row in reader]
+
+	def legacy_parse(value):
+		return datetime.strptime(value[:-3] + value[-2:], '%Y-%m-%dT%H:%M:%S.%f%z')
+
+	start = time.perf_counter()
+	for _ in range(repeat):
+		legacy = [legacy_parse(value) for value in values]
+	legacy_time = (time.perf_counter() - start) / repeat
+	start = time.perf_counter()
+	for _ in range(repeat):
+		parsed = parse_timestamps(values)
+	parsed_time = (time.perf_counter() - start) / repeat
+
+	assert legacy == parsed
+	print(f'{len(values)} timestamps from {orders_file}.csv, averaged over {repeat} runs')
+	print(f'strptime:         {legacy_time * 1e6 / len(values):.2f} us/row')
+	print(f'parse_timestamps: {parsed_time * 1e6 / len(values):.2f} us/row ({legacy_time / parsed_time:.1f}x)')
+
+scale_sizes = [(50, 200, 200), (100, 500, 500), (200, 1000, 1000)]
+
+def measure(run):
+	'''
+	runs the callable once for its wall time, then again under tracemalloc for its peak memory
+	tracemalloc slows python down, so both are never taken from the same run
+	:return: (result of the timed run, wall seconds, peak bytes)
+	'''
+
+	start = time.perf_counter()
+	result = run()
+	elapsed = time.perf_counter() - start
+	tracemalloc.start()
+	run()
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return result, elapsed, peak
+
+def benchmark_scale(sizes, days, cost_factor, seed, results_file):
+	'''
+	times find_path, the timeline & a full in-memory simulation on synthetic networks of each size
+	every measurement is appended to the results file as a json line, so runs can be compared over time
+	'''
+
+	recorded_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+	print(f'{"nodes":>6} {"links":>8} {"orders":>7} {"case":>11} {"ops":>8} {"seconds":>9} {"ops/sec":>10} {"peak MB":>8}')
+	with tempfile.TemporaryDirectory() as directory, open(results_file, 'a') as results:
+		for n_nodes, n_links, n_orders in sizes:
+			nodes, links, origins, destinations = generate_schedule(n_nodes, n_links, days, seed)
+			orders = generate_orders(n_orders, origins, destinations, days, seed)
+			graph_file = os.path.join(directory, f'graph-{n_nodes}')
+			orders_file = os.path.join(directory, f'orders-{n_nodes}')
+			write_graph(graph_file, nodes, links)
+			write_orders(orders_file, orders)
+			g = schedule_to_networkx(nodes, links)
+			outputs = iter(range(2))
+
+			def run_find_path():
+				for order in orders:
+					find_path(g, order, cost_factor)
+				return len(orders)
+
+			def run_timeline():
+				timeline = Timeline()
+				for link in links:
+					timeline.push(Event(link['properties']['startDate'], 'leave', link))
+				while len(timeline):
+					timeline.pop()
+				return timeline.processed
+
+			def run_simulation():
+				output_file = os.path.join(directory, f'output-{n_nodes}-{next(outputs)}.csv')
+				with redirect_stdout(io.StringIO()):
+					sim = Simulator(graph_file, orders_file, output_file, cost_factor=cost_factor, backend='MEMORY')
+					sim.run_simulation()
+				return sim.timeline.processed
+
+			for case, run in [('find_path', run_find_path), ('timeline', run_timeline), ('simulation', run_simulation)]:
+				operations, elapsed, peak = measure(run)
+				row = {
+					'suite': 'scale',
+					'case': case,
+					'nodes': n_nodes,
+					'links': len(links),
+					'days': days,
+					'orders': n_orders,
+					'operations': operations,
+					'wall_seconds': round(elapsed, 4),
+					'per_second': round(operations / elapsed, 1),
+					'peak_mb': round(peak / 2 ** 20, 2),
+					'cost_factor': cost_factor,
+					'seed': seed,
+					'recorded_at': recorded_at,
+					'python': platform.python_version()
+				}
+				results.write(json.dumps(row) + '\n')
+				print(
+					f'{n_nodes:>6} {len(links):>8} {n_orders:>7} {case:>11} {operations:>8} '
+					f'{elapsed:>9.3f} {row["per_second"]:>10.1f} {row["peak_mb"]:>8.2f}'
+				)
+	print(f'\nResults appended to {results_file}')
+
+def benchmark_records(n_orders, days, seed):
+	'''
+	compares the memory held by a timeline's worth of events, as dicts with eager descriptions, action lists
+	& nested tuple links against the Event & Link records
+	every order gets a leave, expire & arrive event per link on its path, and a deliver event at the end
+	'''
+
+	nodes, links, origins, destinations = generate_schedule(100, 500, days, seed)
+	g = schedule_to_networkx(nodes, links)
+	orders = generate_orders(n_orders, origins, destinations, days, seed)
+	paths = [path for path, _ in (find_path(g, order, 'time') for order in orders) if path]
+
+	class Actions:
+		def create_order(self): pass
+		def increment_order_count(self): pass
+		def decrement_order_count(self): pass
+		def expire_link(self): pass
+		def order_delivered(self): pass
+
+	actions = Actions()
+
+	def get_actions(event_type):
+		return {
+			'create': [actions.create_order, actions.increment_order_count],
+			'arrive': [],
+			'leave': [actions.decrement_order_count],
+			'expire': [actions.expire_link],
+			'deliver': [actions.order_delivered]
+		}[event_type]
+
+	def legacy_events():
+		events = []
+		for i, path in enumerate(paths):
+			tracking_no = f'SYN{i:07d}'
+			end_node = path[0].to_node
+			for link in path:
+				link = ((link.from_node, link.from_label), (link.to_node, link.to_label), link.data)
+				kwargs = {'link': link, 'tracking_no': tracking_no}
+				from_node, to_node, leave_time = link[0][0], link[1][0], link[2]['startDate']
+				events.append({
+					'datetime': leave_time, 'type': 'leave', 'desc': f'Leave node: {from_node}',
+					'actions': get_actions('leave'), 'kwargs': kwargs
+				})
+				events.append({
+					'datetime': leave_time, 'type': 'expire', 'desc': f'Expire link: ({from_node}) -> ({to_node}) at {str(leave_time)}',
+					'actions': get_actions('expire'), 'kwargs': kwargs
+				})
+				arrive_kwargs = {'tracking_no': tracking_no, 'link': link, 'delay': 0, 'arrive_time': link[2]['endDate']}
+				events.append({
+					'datetime': link[2]['endDate'], 'type': 'arrive', 'desc': f'Arrive node: {to_node}',
+					'actions': get_actions('arrive'), 'kwargs': arrive_kwargs
+				})
+				if to_node == end_node:
+					events.append({
+						'datetime': link[2]['endDate'], 'type': 'deliver', 'desc': f'Order {tracking_no} delivered to {to_node}',
+						'actions': get_actions('deliver'), 'kwargs': kwargs
+					})
+		return events
+
+	def record_events():
+		events = []
+		for i, path in enumerate(paths):
+			tracking_no = f'SYN{i:07d}'
+			end_node = path[0].to_node
+			for link in path:
+				link = Link(link.from_node, link.from_label, link.to_node, link.to_label, link.data)
+				kwargs = {'link': link, 'tracking_no': tracking_no}
+				events.append(Event(link.data['startDate'], 'leave', kwargs))
+				events.append(Event(link.data['startDate'], 'expire', kwargs))
+				arrive_kwargs = {'tracking_no': tracking_no, 'link': link, 'delay': 0, 'arrive_time': link.data['endDate']}
+				events.append(Event(link.data['endDate'], 'arrive', arrive_kwargs))
+				if link.to_node == end_node:
+					events.append(Event(link.data['endDate'], 'deliver', kwargs))
+		return events
+
+	print(f'{len(paths)} routed orders')
+	print(f'{"records":>8} {"events":>9} {"seconds":>8} {"MB":>8} {"bytes/event":>12}')
+	for name, build in [('dicts', legacy_events), ('slots', record_events)]:
+		tracemalloc.start()
+		start = time.perf_counter()
+		events = build()
+		elapsed = time.perf_counter() - start
+		size = tracemalloc.get_traced_memory()[0]
+		tracemalloc.stop()
+		print(f'{name:>8} {len(events):>9} {elapsed:>8.3f} {size / 2 ** 20:>8.2f} {size / len(events):>12.1f}')
+		del events
+
+def benchmark_batch(sizes, queries, days, seed):
+	'''
+	compares routing a wave of orders leaving one origin one at a time with find_path against one route_batch search
+	'''
+
+	print(f'{"nodes":>8} {"links":>8} {"orders":>7} {"search":>10} {"found":>6} {"ms/order":>10}')
+	for n_nodes, n_links in sizes:
+		g, origins, destinations = generate_network(n_nodes, n_links, days, seed)
+		rng = random.Random(seed)
+		created_on = datetime(2019, 8, 23, tzinfo=timezone.utc)
+		origin = rng.choice(origins)
+		orders = [{'origin_zone': origin, 'destination_zone': rng.choice(destinations), 'created_on': created_on} for _ in range(queries)]
+
+		start = time.perf_counter()
+		single = [find_path(g, order, 'time')[1] for order in orders]
+		single_time = time.perf_counter() - start
+		start = time.perf_counter()
+		g.graph.pop('csr', None)
+		routes = route_batch(g, origin, created_on, {order['destination_zone'] for order in orders})
+		batch = [path_cost(routes[order['destination_zone']], created_on, 'time') if order['destination_zone'] in routes else None for order in orders]
+		batch_time = time.perf_counter() - start
+
+		assert [round(cost, 6) if cost is not None else None for cost in single] == \
+			[round(cost, 6) if cost is not None else None for cost in batch]
+		found = len([cost for cost in single if cost is not None])
+		for name, elapsed in [('find_path', single_time), ('batch', batch_time)]:
+			print(f'{n_nodes:>8} {g.number_of_edges():>8} {queries:>7} {name:>10} {found:>6} {elapsed * 1000 / queries:>10.3f}')
+
+def benchmark_startup(sizes, days, seed):
+	'''
+	compares loading a graph into the memory backend from its workbook against mapping its compiled snapshot
+	'''
+
+	print(f'{"nodes":>8} {"links":>8} {"source":>9} {"seconds":>9}')
+	with tempfile.TemporaryDirectory() as directory:
+		for n_nodes, n_links in sizes:
+			graph_file = os.path.join(directory, f'graph{n_nodes}')
+			nodes, links, _, _ = generate_schedule(n_nodes, n_links, days, seed)
+			write_graph(graph_file, nodes, links)
+
+			start = time.perf_counter()
+			MemoryHandler().build_graph(*read_workbook(graph_file), clear_graph=True)
+			workbook_time = time.perf_counter() - start
+			compile_snapshot(*read_workbook(graph_file), snapshot_path(graph_file))
+			start = time.perf_counter()
+			SnapshotHandler(snapshot_path(graph_file))
+			snapshot_time = time.perf_counter() - start
+			for name, elapsed in [('workbook', workbook_time), ('snapshot', snapshot_time)]:
+				print(f'{n_nodes:>8} {len(links):>8} {name:>9} {elapsed:>9.3f}')
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Benchmarks for the routing simulator')
+	parser.add_argument('-queries', type=int, default=50, help='Number of routing queries per network size')
+	parser.add_argument('-days', type=int, default=7, help='Days of departures per link')
+	parser.add_argument('-factor', type=str, default='time', help='Cost factor, time or cost')
+	parser.add_argument('-seed', type=int, default=0)
+	parser.add_argument('-suite', type=str, default='find_path', choices=['find_path', 'timestamps', 'scale', 'records', 'batch', 'startup'])
+	parser.add_argument('-orders', type=str, default='orders', help='File name of order data csv file')
+	parser.add_argument('-results', type=str, default='benchmark_results.jsonl', help='File the scale suite appends to')
+	args = parser.parse_args()
+
+	if args.suite == 'timestamps':
+		benchmark_timestamps(args.orders, repeat=20)
+	elif args.suite == 'scale':
+		benchmark_scale(scale_sizes, args.days, args.factor, args.seed, args.results)
+	elif args.suite == 'records':
+		benchmark_records(args.queries, args.days, args.seed)
+	elif args.suite == 'startup':
+		benchmark_startup([(100, 500), (500, 5000)], args.days, args.seed)
+	elif args.suite == 'batch':
+		benchmark_batch([(100, 500), (500, 5000), (2000, 20000)], args.queries, args.days, args.seed)
+	else:
+		benchmark_find_path([(100, 500), (500, 5000), (2000, 20000)], args.queries, args.days, args.factor, args.seed)
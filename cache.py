@@ -0,0 +1,81 @@
+from collections import OrderedDict, defaultdict
+
+class SubgraphCache:
+	"""
+	bounded LRU cache of filtered sub graphs, keyed by every order field filter_graph depends on
+	orders with no path are cached too, as a None graph
+	entries holding a link are dropped when the link's timings change
+	"""
+
+	def __init__(self, max_size=256):
+		self.max_size = max_size
+		self._graphs = OrderedDict()
+		self._keys_by_link = defaultdict(set)
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+		self.invalidations = 0
+
+	def __len__(self):
+		return len(self._graphs)
+
+	def __contains__(self, key):
+		# membership only, unlike get it leaves the hit counts & recency alone
+		return key in self._graphs
+
+	@staticmethod
+	def key(order_details):
+		return (
+			order_details.get('start_label') or 'COVERAGEAREA',
+			order_details['origin_zone'],
+			order_details['destination_zone'],
+			order_details['payment_type'],
+			order_details['agent_app']
+		)
+
+	def _remove(self, key):
+		g = self._graphs.pop(key)
+		if g is not None:
+			for node_pair in g.edges():
+				self._keys_by_link[node_pair].discard(key)
+
+	def get(self, key):
+		'''
+		:return: (found, graph), graph is None for cached orders with no path
+		'''
+
+		if key in self._graphs:
+			self.hits += 1
+			self._graphs.move_to_end(key)
+			return True, self._graphs[key]
+		self.misses += 1
+		return False, None
+
+	def put(self, key, g):
+		if self.max_size <= 0:
+			return
+		if key in self._graphs:
+			self._remove(key)
+		self._graphs[key] = g
+		if g is not None:
+			for node_pair in g.edges():
+				self._keys_by_link[node_pair].add(key)
+		while len(self._graphs) > self.max_size:
+			self._remove(next(iter(self._graphs)))
+			self.evictions += 1
+
+	def invalidate(self, link):
+		# drops every cached sub graph holding a link between the link's end nodes
+		for key in list(self._keys_by_link.pop((link.from_node, link.to_node), [])):
+			if key in self._graphs:
+				self._remove(key)
+				self.invalidations += 1
+
+	def stats(self):
+		return {
+			'size': len(self._graphs),
+			'hits': self.hits,
+			'misses': self.misses,
+			'evictions': self.evictions,
+			'invalidations': self.invalidations
+		}
@@ -0,0 +1,70 @@
+from collections import Counter
+
+class LoadIndex:
+	"""
+	in-memory count of the orders booked on every concrete departure, kept in sync by the timeline
+	an order is added to the departures of its path when created and removed from each as it leaves
+	congestion follows the BPR volume delay function, 1 + alpha * (load / capacity) ^ beta
+	capacity is a link's handleableCapacity, links without one never congest
+	"""
+
+	alpha = 0.15
+	beta = 4
+
+	def __init__(self):
+		self._load = Counter()
+		self._bundles = Counter()
+		self.peak_ratio = 0
+		self.overloaded = set()
+
+	@staticmethod
+	def key(from_node, to_node, link_data):
+		# a departure is identified like the db write queries do, with the concrete dates of a recurring departure
+		return from_node, to_node, link_data['startDate'], link_data['endDate'], link_data['cost']
+
+	def add(self, link):
+		key = self.key(link.from_node, link.to_node, link.data)
+		self._load[key] += 1
+		self._bundles[(link.from_node, link.to_node)] += 1
+		capacity = link.data.get('handleableCapacity')
+		if capacity:
+			ratio = self._load[key] / capacity
+			self.peak_ratio = max(self.peak_ratio, ratio)
+			if ratio > 1:
+				self.overloaded.add(key)
+
+	def remove(self, link):
+		key = self.key(link.from_node, link.to_node, link.data)
+		if not self._load[key]:
+			return
+		self._load[key] -= 1
+		if not self._load[key]:
+			del self._load[key]
+		self._bundles[(link.from_node, link.to_node)] -= 1
+		if not self._bundles[(link.from_node, link.to_node)]:
+			del self._bundles[(link.from_node, link.to_node)]
+
+	def carries_load(self, from_node, to_node):
+		# whether any departure between the two nodes has orders booked, bundles without load skip the congestion checks
+		return (from_node, to_node) in self._bundles
+
+	def load(self, from_node, to_node, link_data):
+		return self._load.get(self.key(from_node, to_node, link_data), 0)
+
+	def congestion(self, from_node, to_node, link_data):
+		'''
+		:return: cost multiplier for one more order booking the departure, 1 when the link has no capacity
+		'''
+
+		capacity = link_data.get('handleableCapacity')
+		if not capacity:
+			return 1
+		ratio = (self.load(from_node, to_node, link_data) + 1) / capacity
+		return 1 + self.alpha * ratio ** self.beta
+
+	def stats(self):
+		return {
+			'departures_loaded': len(self._load),
+			'departures_overloaded': len(self.overloaded),
+			'peak_load_ratio': round(self.peak_ratio, 4)
+		}
@@ -0,0 +1,66 @@
+import os
+import pickle
+import threading
+import zlib
+from datetime import timedelta
+
+class Checkpointer:
+	"""
+	writes snapshots of a running simulation every n events or every n hours of simulated time
+	state is pickled on the caller's thread so the snapshot is consistent, compressing and writing
+	happen on a background thread, and the file is replaced atomically so a crash never leaves half a checkpoint
+	"""
+
+	def __init__(self, path, every_events=None, every_hours=None):
+		self.path = path
+		self.every_events = every_events
+		self.every = timedelta(hours=every_hours) if every_hours else None
+		self.saved = 0
+		self._last_events = 0
+		self._last_clock = None
+		self._thread = None
+
+	def due(self, processed, clock):
+		if self._last_clock is None:
+			self._last_clock = clock
+		if self.every_events and processed - self._last_events >= self.every_events:
+			return True
+		return bool(self.every and clock - self._last_clock >= self.every)
+
+	def mark(self, processed, clock):
+		# the next checkpoint is counted from here
+		self._last_events = processed
+		self._last_clock = clock
+
+	def save(self, state, processed, clock, wait=False):
+		data = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+		self.mark(processed, clock)
+		self.wait()
+		self._thread = threading.Thread(target=self._write, args=(data,), daemon=True)
+		self._thread.start()
+		self.saved += 1
+		if wait:
+			self.wait()
+
+	def _write(self, data):
+		temp_path = f'{self.path}.tmp'
+		with open(temp_path, 'wb') as checkpoint_file:
+			checkpoint_file.write(zlib.compress(data, 1))
+			checkpoint_file.flush()
+			os.fsync(checkpoint_file.fileno())
+		os.replace(temp_path, self.path)
+
+	def wait(self):
+		if self._thread is not None:
+			self._thread.join()
+			self._thread = None
+
+	def remove(self):
+		self.wait()
+		if os.path.exists(self.path):
+			os.remove(self.path)
+
+	@staticmethod
+	def load(path):
+		with open(path, 'rb') as checkpoint_file:
+			return pickle.loads(zlib.decompress(checkpoint_file.read()))
@@ -1,30 +1,26 @@
 import re
+import threading
 import time
 
+import networkx as nx
 from neo4j import GraphDatabase
 
-def format_link_data(link):
-	link_data = '{'
-	for key, val in link.items():
-		if key in ['startDate', 'endDate', 'cutOffTime'] and val not in ['', 0, '0']:
-			link_data += f'{key}: datetime("{str(val)[:19]}"), '
-		elif key != 'order_count':
-			if isinstance(val, str):
-				link_data += f'{key}:"{val}", '
-			else:
-				link_data += f'{key}:{val}, '
-	return link_data[:-2] + '}'
-
-def time_and_rollback(func):
+from graph import base_properties
+from memory_handler import link_key
 
-	def wrapper_func(*args, **kwargs):
-		start = time.time()
-		res = func(*args, **kwargs)
-		end = time.time()
-		res['time'] = end - start
-		return res
+def link_row(link, **kwargs):
+	'''
+	parameters identifying a link in the batched write queries: its end nodes & every stored property but the order count,
+	as link_key matches links in MemoryHandler, departures of a recurring link match the stored link
+	'''
 
-	return wrapper_func
+	properties = base_properties(link.data)
+	return dict(
+		from_name=link.from_node,
+		to_name=link.to_node,
+		properties={key: val for key, val in properties.items() if key != 'order_count'},
+		**kwargs
+	)
 
 class DBHandler:
 	"""
@@ -40,13 +36,38 @@ class DBHandler:
 		'consignee_city': 'to_name',
 		'pickup_city': 'from_name'
 	}
+	batch_size = 5000
+	write_queries = {
+		'increment': 'SET rel.order_count = coalesce(rel.order_count, 0) + 1',
+		'decrement': 'SET rel.order_count = coalesce(rel.order_count, 0) - 1',
+		'expire': "SET rel.startDate = rel.startDate + duration('P1D'), rel.endDate = rel.endDate + duration('P1D')"
+	}
 
 	def __init__(self):
 		self._driver = GraphDatabase.driver(self.uri, auth=self.credentials)
+		self._pending = []
+		self._local = threading.local()
+		self._sessions = []
 
 	def finish(self):
+		self.flush()
+		for session in self._sessions:
+			session.close()
 		self._driver.close()
 
+	def _session(self):
+		# one session per thread, kept open for the run, a session must not be shared between threads
+		session = getattr(self._local, 'session', None)
+		if session is None:
+			session = self._driver.session()
+			self._local.session = session
+			self._sessions.append(session)
+		return session
+
+	def _queue(self, kind, link, **kwargs):
+		row = link_row(link, **kwargs)
+		self._pending.append(((kind, link.from_label, link.to_label, tuple(sorted(row['properties']))), row))
+
 	@staticmethod
 	def _clear_graph(tx):
 		print('clearing graph...')
@@ -54,23 +75,64 @@ class DBHandler:
 		print('graph cleared!')
 
 	@staticmethod
-	def _create_graph(tx, nodes, links):
+	def _create_constraints(tx, labels):
+		for label in labels:
+			tx.run(f'CREATE CONSTRAINT ON (n:{label}) ASSERT n.name IS UNIQUE')
+
+	@staticmethod
+	def _create_nodes(tx, label, rows):
+		query = \
+			f'UNWIND $rows AS row'\
+			f'\nMERGE (n:{label} {{name: row.name}})'\
+			f'\nSET n += row.properties'
+		tx.run(query, rows=rows)
+
+	@staticmethod
+	def _create_links(tx, from_label, link_type, to_label, keys, rows):
+		# merged on every stored property but the order count, like link_key, so links differing in any of them are kept apart
+		identity = ', '.join(f'`{key}`: row.properties.`{key}`' for key in keys)
+		query = \
+			f'UNWIND $rows AS row'\
+			f'\nMATCH (start:{from_label} {{name: row.from_name}}), (end:{to_label} {{name: row.to_name}})'\
+			f'\nMERGE (start)-[rel:{link_type} {{{identity}}}]->(end)'\
+			f'\nON CREATE SET rel = row.properties'
+		tx.run(query, rows=rows)
+
+	def _create_graph(self, session, nodes, links):
+		'''
+		bulk loads the graph as parameter lists, one UNWIND query per batch of nodes or links sharing labels
+		names are only ever passed as parameters, so any name maps to exactly one node
+		'''
+
 		print('creating graph...')
-		query = ''
+		start = time.time()
+		node_rows = {}
 		for node in nodes:
-			label = node.pop('label')
-			node_name = re.sub("[^a-zA-Z]+", "", node['name'])
-			node_query = f'merge ({node_name}:{label}{{name:{node["name"]}{node.get("attr","")}}})\n'
-			query += node_query.replace('”', '"').replace("’", "'").replace('‘', "'")
+			node_rows.setdefault(node['label'], []).append({'name': node['name'], 'properties': node['properties']})
+		link_rows = {}
 		for link in links:
-			node1_name = re.sub("[^a-zA-Z]+", "", link['node1'])
-			node2_name = re.sub("[^a-zA-Z]+", "", link['node2'])
-			new_link = f'merge ({node1_name})-[:{link["link"]}{{{link["attr"]}}}]->({node2_name})\n'
-			query += new_link
-		final_query = query.replace('”', '"').replace("’", "'").replace('‘', "'")[:-1]
-		res = tx.run(final_query)
-		print('graph created!')
-		return res
+			properties = link['properties']
+			keys = tuple(sorted(key for key in properties if key != 'order_count'))
+			link_rows.setdefault((link['node1_label'], link['link'], link['node2_label'], keys), []).append({
+				'from_name': link['node1'],
+				'to_name': link['node2'],
+				'properties': properties
+			})
+
+		# schema changes cannot share a transaction with writes
+		session.write_transaction(self._create_constraints, node_rows.keys())
+		for label, rows in node_rows.items():
+			for i in range(0, len(rows), self.batch_size):
+				session.write_transaction(self._create_nodes, label, rows[i:i + self.batch_size])
+		for (from_label, link_type, to_label, keys), rows in link_rows.items():
+			for i in range(0, len(rows), self.batch_size):
+				session.write_transaction(self._create_links, from_label, link_type, to_label, keys, rows[i:i + self.batch_size])
+
+		elapsed = max(time.time() - start, 1e-6)
+		print(
+			f'graph created! {len(nodes)} nodes, {len(links)} links in {elapsed:.2f}s '
+			f'({(len(nodes) + len(links)) / elapsed:.0f} records/s)'
+		)
 
 	@staticmethod
 	def _update_count(tx, links):
@@ -92,9 +154,11 @@ class DBHandler:
 	@staticmethod
 	def _filter_graph(tx, order_details):
 		label = order_details.get('start_label') if order_details.get('start_label') else 'COVERAGEAREA'
+		# no destination zone matches paths to every coverage area, for routing a batch of orders at once
+		destination = f' {{name: "{order_details["destination_zone"]}"}}' if order_details['destination_zone'] else ''
 		query = \
 			f'MATCH path = (:{label} {{name: "{order_details["origin_zone"]}"}}) -[road:CONNECTED_TO*..15]'\
-			f'-> (:COVERAGEAREA {{name: "{order_details["destination_zone"]}"}})'\
+			f'-> (:COVERAGEAREA{destination})'\
 			f'\nwhere Any (r IN road WHERE r.paymentType in ["Both", "{order_details["payment_type"]}"] and not "{order_details["agent_app"]}" in r.restrictedMerchants)'\
 			'\nRETURN path'
 
@@ -106,42 +170,16 @@ class DBHandler:
 			return g
 
 	@staticmethod
-	def _decrement_order(tx, tracking_no, link):
-		from_node = link[0]
-		to_node = link[1]
-		link_data = format_link_data(link[2])
-
-		query = \
-			f'match (from:{from_node[1]}{{name:"{from_node[0]}"}}), (end:{to_node[1]}{{name:"{to_node[0]}"}})'\
-			f'\nmatch (start)-[rel:CONNECTED_TO{link_data}]->(end)'\
-			f'\nwith rel,FILTER(x IN rel.order_count WHERE x <> "{tracking_no}") as filteredList'\
-			f'\nset rel.order_count = filteredList'
-
-		tx.run(query)
-
-	@staticmethod
-	def _increment_order(tx, tracking_no, link):
-		from_node = link[0]
-		to_node = link[1]
-		link_data = format_link_data(link[2])
-		query = \
-			f'match (from:{from_node[1]}{{name:"{from_node[0]}"}}), (end:{to_node[1]}{{name:"{to_node[0]}"}})'\
-			f'\nmerge (start)-[rel:CONNECTED_TO{link_data}]->(end)'\
-			f'\non create set rel.order_count = ["{tracking_no}"]'\
-			f'\non match set rel.order_count = rel.order_count + "{tracking_no}"'
-
-		tx.run(query)
-
-	@staticmethod
-	def _expire_link(tx, link):
-		from_node = link[0]
-		to_node = link[1]
-		link_data = format_link_data(link[2])
-		query = \
-			f"match (start:{from_node[1]}{{name:'{from_node[0]}'}})-[rel:CONNECTED_TO{link_data}]->(end:{to_node[1]}{{name:'{to_node[0]}'}})"\
-			f"set rel.startDate=rel.startDate+ duration('P1D'), rel.endDate = rel.endDate + duration('P1D')"
-
-		tx.run(query)
+	def _write_batches(tx, batches):
+		# one UNWIND query per run of writes of the same kind between the same node labels, on links with the same properties
+		for (kind, from_label, to_label, keys), rows in batches:
+			identity = ' AND '.join(f'rel.`{key}` = row.properties.`{key}`' for key in keys)
+			query = \
+				f'UNWIND $rows AS row'\
+				f'\nMATCH (:{from_label} {{name: row.from_name}})-[rel:CONNECTED_TO]->(:{to_label} {{name: row.to_name}})'\
+				f'\nWHERE {identity}'\
+				f'\n{DBHandler.write_queries[kind]}'
+			tx.run(query, rows=rows)
 
 	### PUBLIC METHODS ###
 
@@ -150,22 +188,58 @@ class DBHandler:
 			if clear_graph:
 				session.write_transaction(self._clear_graph)
 
-			session.write_transaction(self._create_graph, nodes, links)
+			self._create_graph(session, nodes, links)
 
 	def filter_graph(self, order_details):
-		with self._driver.session() as session:
-			res = session.write_transaction(self._filter_graph, order_details)
-			return res
+		# queued writes may move link timings, so they land before the read
+		self.flush()
+		return self._session().write_transaction(self._filter_graph, order_details)
+
+	@staticmethod
+	def to_networkx(sub_graph):
+		g = nx.MultiDiGraph()
+		for r in sub_graph.relationships:
+			from_node = r.nodes[0]
+			g.add_node(from_node['name'], label=list(from_node.labels)[0], **from_node._properties)
+			to_node = r.nodes[1]
+			g.add_node(to_node['name'], label=list(to_node.labels)[0], **to_node._properties)
+			g.add_edge(from_node['name'], to_node['name'], attr_dict=r._properties)
+		return g
 
 	def increment_order_count(self, tracking_no, links):
-		with self._driver.session() as session:
-			for link in links:
-				session.write_transaction(self._increment_order, tracking_no, link)
+		for link in links:
+			self._queue('increment', link)
 
 	def decrement_order_count(self, link, tracking_no):
-		with self._driver.session() as session:
-			session.write_transaction(self._decrement_order, tracking_no, link)
+		self._queue('decrement', link)
 
 	def expire_link(self, link):
-		with self._driver.session() as session:
-			session.write_transaction(self._expire_link, link)
+		self._queue('expire', link)
+
+	def flush(self):
+		'''
+		writes every queued order count update and link expiry in a single transaction
+		:return: number of writes coalesced into the transaction
+		'''
+
+		if not self._pending:
+			return 0
+
+		batches = []
+		expired = set()
+		for key, row in self._pending:
+			if key[0] == 'expire':
+				# every order taking a departure expires it, a single UNWIND would move it once per order
+				link_id = link_key(row['from_name'], row['to_name'], row['properties'])
+				if link_id in expired:
+					continue
+				expired.add(link_id)
+			if batches and batches[-1][0] == key:
+				batches[-1][1].append(row)
+			else:
+				batches.append((key, [row]))
+		writes = len(self._pending)
+		self._pending = []
+
+		self._session().write_transaction(self._write_batches, batches)
+		return writes
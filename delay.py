@@ -0,0 +1,70 @@
+import json
+
+import numpy as np
+
+default_weights = {
+	0: 50,
+	0.5: 20,
+	1: 15,
+	3: 10,
+	5: 5
+}
+
+def _parse_delay(delay):
+	# json keys are strings, whole hours are kept as ints so results read as before
+	delay = float(delay)
+	return int(delay) if delay.is_integer() else delay
+
+class DelayModel:
+	"""
+	draws the hours a link arrives late from weighted distributions, one for the network and optionally one per partner
+	partners are matched on a link's operatedBy, links of other partners use the network's distribution
+	draws come from the model's own seeded generator, a block at a time per distribution,
+	so a run with the same seed & the same events gets the same delays
+	"""
+
+	def __init__(self, weights=None, partner_weights=None, seed=None, block_size=4096):
+		self.seed = seed
+		self.block_size = block_size
+		self._rng = np.random.default_rng(seed)
+		self._distributions = {None: self._distribution(weights or default_weights)}
+		for partner, partner_weight in (partner_weights or {}).items():
+			self._distributions[partner] = self._distribution(partner_weight)
+		self._blocks = {}
+
+	@staticmethod
+	def _distribution(weights):
+		# (delays, cumulative probabilities), a uniform draw u picks the first delay whose cumulative probability exceeds u
+		delays = [_parse_delay(delay) for delay in weights]
+		cumulative = np.cumsum([weights[delay] for delay in weights], dtype=np.float64)
+		if not len(cumulative) or cumulative[-1] <= 0:
+			raise ValueError(f'Delay weights must have a positive total: {weights}')
+		return delays, cumulative / cumulative[-1]
+
+	@classmethod
+	def from_file(cls, path, seed=None):
+		'''
+		reads weights from a json file, {"default": {"0": 50, "1": 50}, "partners": {"PartnerA": {"0": 90, "3": 10}}}
+		either part may be left out
+		'''
+
+		with open(path) as weights_file:
+			weights = json.load(weights_file)
+		return cls(weights.get('default'), weights.get('partners'), seed)
+
+	def sample(self, link_data):
+		'''
+		:return: delay in hours for one arrival over the link
+		'''
+
+		key = link_data.get('operatedBy')
+		if key not in self._distributions:
+			key = None
+		block = self._blocks.get(key)
+		if block is None or not block[1]:
+			delays, cumulative = self._distributions[key]
+			picks = np.searchsorted(cumulative, self._rng.random(self.block_size), side='right')
+			block = [[delays[i] for i in picks.tolist()], self.block_size]
+			self._blocks[key] = block
+		block[1] -= 1
+		return block[0][block[1]]
@@ -1,97 +1,331 @@
+import heapq
+from bisect import bisect_right
 from datetime import datetime
+from itertools import count
 
-def calculate_financial_cost(link_data):
-	# return (len(link_data['order_count']) + 1) * link_data['cost']
-	return link_data['cost']
+from parsing import parse_duration
+from records import Link
 
-def calculate_time_cost(link_data, start_date):
+def calculate_financial_cost(link_data, congestion=1):
+	return link_data['cost'] * congestion
+
+def calculate_time_cost(link_data, start_date, congestion=1):
+	# congestion stretches the travel time of the link, waiting for the departure is not affected
 	diff = link_data['endDate'] - start_date
 	cost = (diff.days * 24) + (diff.seconds/3600)
+	if congestion != 1:
+		travel = link_data['endDate'] - link_data['startDate']
+		cost += ((travel.days * 24) + (travel.seconds/3600)) * (congestion - 1)
 
 	return cost
 
-def find_cost(start_date, links, cost_factor):
-	link_id = min(
-		(link for link, val in links.items() if val['attr_dict']['startDate'] > start_date),
-		key=lambda x: links[x]['attr_dict']['startDate']
-	)
-	link_data = links[link_id]['attr_dict']
+def accepts_order(link_data, order_details):
+	# filter_graph keeps paths with any link accepting the order's payment type & merchant, a missing property never matches
+	restricted = link_data.get('restrictedMerchants')
+	return link_data.get('paymentType') in ['Both', order_details['payment_type']] \
+		and restricted is not None and order_details['agent_app'] not in restricted
+
+def base_properties(link_data):
+	# the stored properties of a link, undoing the dates of a materialised departure of a recurring link
+	if 'scheduledStart' not in link_data:
+		return link_data
+	properties = {key: val for key, val in link_data.items() if key not in ['scheduledStart', 'scheduledEnd']}
+	properties['startDate'] = link_data['scheduledStart']
+	properties['endDate'] = link_data['scheduledEnd']
+	return properties
+
+class Departures:
+	"""
+	departure index of a bundle of parallel links between two nodes
+	one off links are sorted by start date, so the links still departing after a given time are a suffix found by bisection
+	the best link of every suffix is precomputed for both cost factors
+	recurring links are stored once with their first departure, later departures are materialised when first asked for
+	bundles with orders booked on them are scanned in full instead, as the load changes which departure is best
+	"""
+
+	def __init__(self, links, from_node=None, to_node=None):
+		one_off = [link_id for link_id in links if not links[link_id]['attr_dict'].get('recurrence')]
+		ordered = sorted(one_off, key=lambda x: links[x]['attr_dict']['startDate'])
+		self.links = links
+		self.from_node = from_node
+		self.to_node = to_node
+		self.ordered = ordered
+		self.start_dates = [links[link_id]['attr_dict']['startDate'] for link_id in ordered]
+		self.fastest = self._suffix_best(ordered, lambda x: (links[x]['attr_dict']['endDate'], links[x]['attr_dict']['cost']))
+		self.cheapest = self._suffix_best(ordered, lambda x: (links[x]['attr_dict']['cost'], links[x]['attr_dict']['endDate']))
+		self.recurring = [
+			(link_id, parse_duration(links[link_id]['attr_dict']['recurrence'])) for link_id in links if link_id not in one_off
+		]
+		self._occurrences = {}
+		self._fronts = {}
+
+	@staticmethod
+	def _suffix_best(ordered, key):
+		best = [None] * len(ordered)
+		for i in range(len(ordered) - 1, -1, -1):
+			if i == len(ordered) - 1 or key(ordered[i]) <= key(best[i + 1]):
+				best[i] = ordered[i]
+			else:
+				best[i] = best[i + 1]
+		return best
+
+	def _next_occurrence(self, link_id, period, start_date):
+		# number of the first departure of a recurring link strictly after start_date
+		link_data = self.links[link_id]['attr_dict']
+		if start_date < link_data['startDate']:
+			return 0
+		return (start_date - link_data['startDate']) // period + 1
+
+	def occurrence(self, link_id, period, n):
+		'''
+		nth departure of a recurring link, counting the stored one as 0
+		later departures are copies of the stored properties with concrete dates, the stored dates are kept as scheduledStart & scheduledEnd
+		copies are kept, so every order taking a departure shares its link data
+		'''
+
+		link_data = self.links[link_id]['attr_dict']
+		if n == 0:
+			return link_data
+		occurrence = self._occurrences.get((link_id, n))
+		if occurrence is None:
+			occurrence = dict(
+				link_data,
+				startDate=link_data['startDate'] + n * period,
+				endDate=link_data['endDate'] + n * period,
+				scheduledStart=link_data['startDate'],
+				scheduledEnd=link_data['endDate']
+			)
+			self._occurrences[(link_id, n)] = occurrence
+		return occurrence
+
+	def congestion(self, link_data, load=None):
+		return load.congestion(self.from_node, self.to_node, link_data) if load is not None else 1
+
+	def _find_congested(self, start_date, cost_factor, load):
+		# every departure after start_date is priced with its congestion, recurring links up to their first departure without load
+		if cost_factor == 'cost':
+			key = lambda x: (calculate_financial_cost(x, self.congestion(x, load)), x['endDate'])
+		else:
+			key = lambda x: (calculate_time_cost(x, start_date, self.congestion(x, load)), x['cost'])
+
+		candidates = [self.links[link_id]['attr_dict'] for link_id in self.ordered[bisect_right(self.start_dates, start_date):]]
+		for link_id, period in self.recurring:
+			n = self._next_occurrence(link_id, period, start_date)
+			while True:
+				link_data = self.occurrence(link_id, period, n)
+				candidates.append(link_data)
+				if not load.load(self.from_node, self.to_node, link_data):
+					break
+				n += 1
+		return min(candidates, key=key, default=None)
+
+	def frontier(self, start_date, load=None):
+		'''
+		the departures after start_date no other departure beats on both cost & arrival, what a cost search has to try:
+		a pricier link is only worth taking if it arrives earlier, in time for onward links the cheaper ones miss
+		:return: list of (cost, link properties), cheapest first, each arriving earlier than the one before
+		'''
+
+		congested = load is not None and load.carries_load(self.from_node, self.to_node)
+		i = bisect_right(self.start_dates, start_date)
+		if congested:
+			candidates = [self.links[link_id]['attr_dict'] for link_id in self.ordered[i:]]
+		else:
+			# the one off links of a suffix only depend on where it starts, so their frontier is kept
+			candidates = self._fronts.get(i)
+			if candidates is None:
+				one_off = [self.links[link_id]['attr_dict'] for link_id in self.ordered[i:]]
+				candidates = [link_data for _, link_data in self._pareto(one_off)]
+				self._fronts[i] = candidates
+			candidates = list(candidates)
+		for link_id, period in self.recurring:
+			# later departures of a recurring link cost the same & arrive later, unless the earlier ones are congested
+			n = self._next_occurrence(link_id, period, start_date)
+			while True:
+				link_data = self.occurrence(link_id, period, n)
+				candidates.append(link_data)
+				if not congested or not load.load(self.from_node, self.to_node, link_data):
+					break
+				n += 1
+		return self._pareto(candidates, load if congested else None)
+
+	def _pareto(self, candidates, load=None):
+		# cheapest first, ties to the earliest arrival, each link is kept if it arrives before every cheaper one
+		priced = sorted(
+			(calculate_financial_cost(link_data, self.congestion(link_data, load)), link_data['endDate'], i)
+			for i, link_data in enumerate(candidates)
+		)
+		front = []
+		for cost, end_date, i in priced:
+			if not front or end_date < front[-1][1]['endDate']:
+				front.append((cost, candidates[i]))
+		return front
+
+	def find(self, start_date, cost_factor, load=None):
+		# properties of the best link departing strictly after start_date, None if every link has left
+		if load is not None and load.carries_load(self.from_node, self.to_node):
+			return self._find_congested(start_date, cost_factor, load)
+		if cost_factor == 'cost':
+			key = lambda x: (x['cost'], x['endDate'])
+		else:
+			key = lambda x: (x['endDate'], x['cost'])
+
+		best = None
+		i = bisect_right(self.start_dates, start_date)
+		if i < len(self.start_dates):
+			link_id = self.cheapest[i] if cost_factor == 'cost' else self.fastest[i]
+			best = self.links[link_id]['attr_dict']
+		for link_id, period in self.recurring:
+			link_data = self.occurrence(link_id, period, self._next_occurrence(link_id, period, start_date))
+			if best is None or key(link_data) < key(best):
+				best = link_data
+		return best
+
+def get_departures(g, from_node, to_node):
+	# departure indexes are built on first use and kept on the graph, which is not modified once filtered
+	index = g.graph.setdefault('departures', {})
+	departures = index.get((from_node, to_node))
+	if departures is None:
+		departures = Departures(g[from_node][to_node], from_node, to_node)
+		index[(from_node, to_node)] = departures
+	return departures
+
+def find_cost(start_date, departures, cost_factor, load=None):
+	'''
+	picks the best link out of a bundle of parallel links, among those departing after start_date
+	time: earliest arrival, cost: cheapest link, ties go to the other factor
+	with a load index, costs include the congestion of each departure
+	:return: (cost, link properties), or (None, None) when no link departs after start_date
+	'''
+
+	link_data = departures.find(start_date, cost_factor, load)
+	if link_data is None:
+		return None, None
+
+	congestion = departures.congestion(link_data, load)
 	if cost_factor == 'cost':
-		cost = calculate_financial_cost(link_data)
+		cost = calculate_financial_cost(link_data, congestion)
 	else:
-		cost = calculate_time_cost(link_data, start_date)
+		cost = calculate_time_cost(link_data, start_date, congestion)
+
+	return cost, link_data
+
+def find_heuristic_cost(g, end_node, cost_factor):
+	'''
+	builds an admissible heuristic for routing towards end_node
+	runs a backward dijkstra over the graph ignoring departure times, so waiting is never counted
+	time: shortest total travel time of the links, cost: cheapest total link cost
+	:return: function(node) -> lower bound on the remaining cost, None if end_node is unreachable
+	'''
+
+	def link_cost(link_data):
+		if cost_factor == 'cost':
+			return calculate_financial_cost(link_data)
+		return calculate_time_cost(link_data, link_data['startDate'])
 
-	return cost, link_id
+	bounds = {end_node: 0}
+	heap = [(0, end_node)]
+	settled = set()
+	while heap:
+		bound, node = heapq.heappop(heap)
+		if node in settled:
+			continue
+		settled.add(node)
+		for prev_node, links in g.pred[node].items():
+			new_bound = bound + min(link_cost(val['attr_dict']) for val in links.values())
+			if prev_node not in settled and new_bound < bounds.get(prev_node, float('inf')):
+				bounds[prev_node] = new_bound
+				heapq.heappush(heap, (new_bound, prev_node))
 
-def find_heuristic_cost():
-	return 0
+	return bounds.get
+
+def get_hubs(g):
+	# JANIO hubs of a sub graph, kept on the graph so every order routed on it shares one set
+	hubs = g.graph.get('hubs')
+	if hubs is None:
+		hubs = frozenset(node for node, hub_type in g.nodes(data='hub_type') if hub_type == 'JANIO')
+		g.graph['hubs'] = hubs
+	return hubs
+
+def get_heuristic(g, end_node, cost_factor):
+	# goal rooted bounds are kept on the graph, so every search towards the same destination reuses them
+	index = g.graph.setdefault('heuristics', {})
+	heuristic = index.get((end_node, cost_factor))
+	if heuristic is None:
+		heuristic = find_heuristic_cost(g, end_node, cost_factor)
+		index[(end_node, cost_factor)] = heuristic
+	return heuristic
+
+def path_cost(links, start_date, cost_factor):
+	# cost of following links, ordered from the end node back, for an order ready to leave at start_date
+	if cost_factor == 'cost':
+		return sum(calculate_financial_cost(link.data) for link in links)
+	return calculate_time_cost(links[0].data, start_date)
 
-def find_path(g, order_details, cost_factor):
-	opened = []
-	closed = []
+def find_path(g, order_details, cost_factor, heuristic=None, load=None):
+	'''
+	time dependent A* search, a link can only be taken if it departs after the order arrives at its start node
+	search states are (node, arrival time), a state is skipped once the node was reached at least as early
+	for a lower or equal cost, so a pricier but earlier arrival is still expanded
+	:param heuristic: function(node) -> admissible lower bound on the remaining cost, defaults to dijkstra
+	:param load: LoadIndex of the orders booked on each departure, costs are congestion free without one
+	:return: (links from the end node back to the start node, cost), ([], None) when no path is found
+	'''
 
 	start_time = order_details['created_on']
 	end_node = order_details['destination_zone']
 	start_node = order_details['origin_zone']
-	current_node = start_node
-	opened.append(current_node)
-	table = {
-		start_node: {
-			'cost_to_start': 0,
-			'heuristic_dist': 0,
-			'f_value': 0,
-			'prev_node': None,
-			'link_id': None,
-			'start_date': start_time,
-			'end_date': start_time,
-			'label': 'COVERAGEAREA'
-		}
-	}
-
-	while current_node != end_node:
-		# iterate thru adj nodes
-		for nbr, links in g[current_node].items():
-			# push node to opened list
-			if nbr not in opened and nbr not in closed:
-				opened.append(nbr)
-				cost, link_id = find_cost(start_time, links, cost_factor)
-				h = find_heuristic_cost()
-				if current_node != start_node:
-					cost_to_start = table[current_node]['cost_to_start'] + cost
-				else:
-					cost_to_start = cost
-				f = cost_to_start + h
-				result = {
-					'cost_to_start': cost_to_start,
-					'heuristic_dist': h,
-					'f_value': f,
-					'prev_node': current_node,
-					'link_id': link_id,
-					'start_date': links[link_id]['attr_dict']['startDate'],
-					'end_date': links[link_id]['attr_dict']['endDate'],
-					'label': g.nodes[nbr]['label']
-				}
-				# update value if not calculated before or if new f value is lower
-				if not table.get(nbr) or (table.get(nbr) and table[nbr]['f_value'] > f):
-					table.update({nbr: result})
-
-		# add node to closed list
-		opened.remove(current_node)
-		if current_node not in closed:
-			closed.append(current_node)
-		# set next opened node to current node
-		current_node = max((key for key in table.keys() if key in opened), key=lambda x: table[x]['f_value'])
-		start_time = table[current_node]['end_date']
-
-	current_node = end_node
-	links = []
+	if heuristic is None:
+		heuristic = lambda node: 0
+
+	h = heuristic(start_node)
+	if start_node not in g or h is None:
+		return [], None
+
+	sequence = count()
+	# state: (cost_to_start, node, arrival, previous state, link properties)
+	states = [(0, start_node, start_time, None, None)]
+	opened = [(h, start_time, next(sequence), 0)]
+	earliest_arrival = {}
+
+	while opened:
+		_, arrival, _, state_id = heapq.heappop(opened)
+		cost_to_start, current_node = states[state_id][:2]
+		if current_node in earliest_arrival and earliest_arrival[current_node] <= arrival:
+			continue
+		earliest_arrival[current_node] = arrival
+
+		if current_node == end_node:
+			break
 
-	while current_node != start_node:
-		prev_node = table[current_node]['prev_node']
-		link_id = table[current_node]['link_id']
-		link_data = g[prev_node][current_node][link_id]['attr_dict']
-		links.append(((prev_node, table[prev_node]['label']), (current_node, table[current_node]['label']), link_data))
-		current_node = prev_node
+		for nbr in g[current_node]:
+			h = heuristic(nbr)
+			if h is None or (nbr in earliest_arrival and earliest_arrival[nbr] <= arrival):
+				continue
 
-	return links, table[end_node]['cost_to_start']
+			departures = get_departures(g, current_node, nbr)
+			if cost_factor == 'cost':
+				# the cheapest link may arrive too late for onward links, so every link not beaten on cost & arrival is tried
+				candidates = departures.frontier(arrival, load)
+			else:
+				cost, link_data = find_cost(arrival, departures, cost_factor, load)
+				candidates = [(cost, link_data)] if link_data is not None else []
+
+			for cost, link_data in candidates:
+				nbr_arrival = link_data['endDate']
+				states.append((cost_to_start + cost, nbr, nbr_arrival, state_id, link_data))
+				heapq.heappush(opened, (cost_to_start + cost + h, nbr_arrival, next(sequence), len(states) - 1))
+	else:
+		return [], None
+
+	links = []
+	cost = states[state_id][0]
+	while states[state_id][3] is not None:
+		_, current_node, _, prev_id, link_data = states[state_id]
+		prev_node = states[prev_id][1]
+		links.append(
+			Link(prev_node, g.nodes[prev_node].get('label', 'COVERAGEAREA'), current_node, g.nodes[current_node]['label'], link_data)
+		)
+		state_id = prev_id
 
+	return links, cost
@@ -0,0 +1,62 @@
+import json
+import time
+from contextlib import contextmanager
+
+class Instrumentation:
+	"""
+	timers and counters for the phases of a simulation run
+	timers accumulate wall time per phase, counters are plain event tallies
+	"""
+
+	def __init__(self):
+		self.timers = {}
+		self.counters = {}
+		self._started = time.perf_counter()
+		self._cpu_started = time.process_time()
+
+	@contextmanager
+	def timer(self, name):
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.add_time(name, time.perf_counter() - start)
+
+	def add_time(self, name, seconds):
+		timer = self.timers.setdefault(name, {'calls': 0, 'seconds': 0.0})
+		timer['calls'] += 1
+		timer['seconds'] += seconds
+
+	def count(self, name, n=1):
+		self.counters[name] = self.counters.get(name, 0) + n
+
+	def summary(self, **extra):
+		'''
+		:return: dict of every timer & counter, with the run's wall and cpu time
+		a cpu / wall ratio well below 1 means the run spent most of its time waiting on I/O
+		'''
+
+		wall = time.perf_counter() - self._started
+		cpu = time.process_time() - self._cpu_started
+		summary = {
+			'wall_seconds': round(wall, 4),
+			'cpu_seconds': round(cpu, 4),
+			'cpu_ratio': round(cpu / wall, 4) if wall else 0,
+			'timers': {
+				name: {
+					'calls': timer['calls'],
+					'seconds': round(timer['seconds'], 4),
+					'mean_ms': round(timer['seconds'] * 1000 / timer['calls'], 4)
+				}
+				for name, timer in sorted(self.timers.items())
+			},
+			'counters': dict(sorted(self.counters.items()))
+		}
+		summary.update(extra)
+		return summary
+
+	def dump(self, path, **extra):
+		summary = self.summary(**extra)
+		with open(path, 'w') as stats_file:
+			json.dump(summary, stats_file, indent=2, default=str)
+		return summary
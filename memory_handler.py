@@ -0,0 +1,175 @@
+from collections import defaultdict, deque
+from datetime import timedelta
+
+import networkx as nx
+
+from graph import accepts_order, base_properties
+
+def _freeze(val):
+	if isinstance(val, list):
+		return tuple(_freeze(v) for v in val)
+	return val
+
+def link_key(from_node, to_node, link_data):
+	# a link is identified by its end nodes & every property but the order count, like the neo4j queries
+	return (
+		from_node,
+		to_node,
+		tuple(sorted((key, _freeze(val)) for key, val in link_data.items() if key != 'order_count'))
+	)
+
+class MemoryHandler:
+	"""
+	in-process alternative to DBHandler
+	keeps the nodes and links sheets in indexed dictionaries and answers the same
+	filtering and order count queries without a round trip to neo4j
+	"""
+
+	max_hops = 15
+
+	def __init__(self):
+		self._clear_graph()
+
+	def finish(self):
+		pass
+
+	def flush(self):
+		# writes are applied immediately, nothing is ever queued
+		return 0
+
+	def _clear_graph(self):
+		self._nodes = {}
+		self._links = {}
+		self._out = defaultdict(list)
+		self._in = defaultdict(list)
+		self._link_ids = defaultdict(list)
+
+	def _create_graph(self, nodes, links):
+		for node in nodes:
+			name = node['name']
+			if name not in self._nodes:
+				self._nodes[name] = {'label': node['label'], 'properties': {}}
+			self._nodes[name]['properties'].update(node['properties'])
+
+		for link in links:
+			from_node = link['node1']
+			to_node = link['node2']
+			properties = dict(link['properties'])
+			key = link_key(from_node, to_node, properties)
+			if self._link_ids.get(key):
+				continue
+			link_id = len(self._links)
+			self._links[link_id] = {'from': from_node, 'to': to_node, 'type': link['link'], 'properties': properties}
+			self._out[from_node].append(link_id)
+			self._in[to_node].append(link_id)
+			self._link_ids[key].append(link_id)
+
+	def _find_links(self, link):
+		# departures of a recurring link are matched to the link as stored
+		return self._link_ids.get(link_key(link.from_node, link.to_node, base_properties(link.data)), [])
+
+	@staticmethod
+	def _is_allowed(properties, order_details):
+		# mirrors the cypher predicate
+		return accepts_order(properties, order_details)
+
+	def _hop_distances(self, sources, adjacency, end, order_details):
+		'''
+		breadth first search over (node, passed an allowed link) states
+		:return: {(node, allowed): fewest hops from the nearest source}
+		'''
+
+		distances = {(source, False): 0 for source in sources}
+		queue = deque(distances)
+		while queue:
+			state = queue.popleft()
+			hops = distances[state]
+			if hops == self.max_hops:
+				continue
+			for link_id in adjacency.get(state[0], []):
+				link = self._links[link_id]
+				if link['type'] != 'CONNECTED_TO':
+					continue
+				nbr = (link[end], state[1] or self._is_allowed(link['properties'], order_details))
+				if nbr not in distances:
+					distances[nbr] = hops + 1
+					queue.append(nbr)
+		return distances
+
+	### PUBLIC METHODS ###
+
+	def build_graph(self, nodes, links, clear_graph):
+		if clear_graph:
+			self._clear_graph()
+		self._create_graph(nodes, links)
+
+	def filter_graph(self, order_details):
+		'''
+		returns the ids of every link on a path of at most 15 hops from the origin to the destination
+		where any link on the path accepts the payment type and merchant, same as DBHandler.filter_graph
+		with no destination zone, paths to every coverage area are kept, for routing a batch of orders at once
+		paths are treated as walks, which only differs from cypher's path matching on cyclic networks
+		'''
+
+		label = order_details.get('start_label') if order_details.get('start_label') else 'COVERAGEAREA'
+		origin = self._nodes.get(order_details['origin_zone'])
+		if order_details['destination_zone']:
+			destination = self._nodes.get(order_details['destination_zone'])
+			if not destination or destination['label'] != 'COVERAGEAREA':
+				return None
+			destinations = [order_details['destination_zone']]
+		else:
+			destinations = [name for name, node in self._nodes.items() if node['label'] == 'COVERAGEAREA']
+		if not origin or origin['label'] != label:
+			return None
+
+		inf = self.max_hops + 1
+		forward = self._hop_distances([order_details['origin_zone']], self._out, 'to', order_details)
+		backward = self._hop_distances(destinations, self._in, 'from', order_details)
+
+		link_ids = []
+		for (node, allowed), hops in forward.items():
+			for link_id in self._out.get(node, []):
+				link = self._links[link_id]
+				if link['type'] != 'CONNECTED_TO':
+					continue
+				allowed_path = allowed or self._is_allowed(link['properties'], order_details)
+				remaining = min(
+					backward.get((link['to'], True), inf),
+					backward.get((link['to'], False), inf) if allowed_path else inf
+				)
+				if hops + 1 + remaining <= self.max_hops:
+					link_ids.append(link_id)
+
+		link_ids = sorted(set(link_ids))
+		return link_ids if link_ids else None
+
+	def to_networkx(self, sub_graph):
+		g = nx.MultiDiGraph()
+		for link_id in sub_graph:
+			link = self._links[link_id]
+			for name in (link['from'], link['to']):
+				node = self._nodes[name]
+				g.add_node(name, label=node['label'], **node['properties'])
+			g.add_edge(link['from'], link['to'], attr_dict=dict(link['properties']))
+		return g
+
+	def increment_order_count(self, tracking_no, links):
+		for link in links:
+			for link_id in self._find_links(link):
+				properties = self._links[link_id]['properties']
+				properties['order_count'] = properties.get('order_count', 0) + 1
+
+	def decrement_order_count(self, link, tracking_no):
+		for link_id in self._find_links(link):
+			properties = self._links[link_id]['properties']
+			properties['order_count'] = properties.get('order_count', 0) - 1
+
+	def expire_link(self, link):
+		key = link_key(link.from_node, link.to_node, link.data)
+		for link_id in self._link_ids.pop(key, []):
+			stored = self._links[link_id]
+			properties = stored['properties']
+			properties['startDate'] += timedelta(days=1)
+			properties['endDate'] += timedelta(days=1)
+			self._link_ids[link_key(stored['from'], stored['to'], properties)].append(link_id)
@@ -0,0 +1,115 @@
+import csv
+import json
+import os
+
+from openpyxl import load_workbook, Workbook
+
+result_fields = ['tracking_no', 'cost_factor', 'conditions', 'path', 'cost']
+
+def _open_append(path, offset, newline=None):
+	# resuming a run drops anything written after its checkpoint
+	if offset is not None:
+		with open(path, 'r+b') as output:
+			output.truncate(offset)
+	return open(path, 'a', newline=newline)
+
+class CSVWriter:
+	"""
+	appends results to a csv file as they complete, every run adds its rows tagged with the run name
+	"""
+
+	def __init__(self, output_file, run_name, offset=None):
+		new_file = not os.path.exists(output_file) or os.path.getsize(output_file) == 0
+		self.run_name = run_name
+		self._file = _open_append(output_file, offset, newline='')
+		self._writer = csv.writer(self._file)
+		if new_file:
+			self._writer.writerow(['run'] + result_fields)
+
+	def write(self, result):
+		self._writer.writerow([self.run_name] + [result[field] for field in result_fields])
+
+	def offset(self):
+		# bytes written so far, recorded in checkpoints
+		self._file.flush()
+		return self._file.tell()
+
+	def close(self):
+		self._file.close()
+
+class JSONLWriter:
+	"""
+	appends results to a json lines file as they complete, every run adds its rows tagged with the run name
+	"""
+
+	def __init__(self, output_file, run_name, offset=None):
+		self.run_name = run_name
+		self._file = _open_append(output_file, offset)
+
+	def write(self, result):
+		row = {'run': self.run_name}
+		row.update((field, result[field]) for field in result_fields)
+		self._file.write(json.dumps(row, default=str) + '\n')
+
+	def offset(self):
+		self._file.flush()
+		return self._file.tell()
+
+	def close(self):
+		self._file.close()
+
+class ExcelWriter:
+	"""
+	writes results into a new sheet of the output workbook, using openpyxl's write only mode
+	rows are spooled to a json lines file as they complete, so a checkpointed run can resume, and the sheet is built on close
+	a workbook cannot be appended to in place, so sheets of earlier runs are streamed across from a read only copy
+	"""
+
+	def __init__(self, output_file, run_name, offset=None):
+		self.output_file = output_file
+		self.run_name = run_name
+		self._spool_file = f'{output_file}.spool'
+		if offset is None:
+			open(self._spool_file, 'w').close()
+		self._spool = _open_append(self._spool_file, offset)
+
+	def write(self, result):
+		self._spool.write(json.dumps([result[field] for field in result_fields], default=str) + '\n')
+
+	def offset(self):
+		self._spool.flush()
+		return self._spool.tell()
+
+	def close(self):
+		self._spool.close()
+		workbook = Workbook(write_only=True)
+		if os.path.exists(self.output_file):
+			previous = load_workbook(self.output_file, read_only=True)
+			for previous_sheet in previous.worksheets:
+				sheet = workbook.create_sheet(previous_sheet.title)
+				for row in previous_sheet.iter_rows(values_only=True):
+					sheet.append(row)
+			previous.close()
+		sheet = workbook.create_sheet(self.run_name)
+		sheet.append(result_fields)
+		with open(self._spool_file) as spool:
+			for line in spool:
+				sheet.append(json.loads(line))
+		workbook.save(self.output_file)
+		os.remove(self._spool_file)
+
+writer_mapping = {
+	'.csv': CSVWriter,
+	'.jsonl': JSONLWriter,
+	'.xlsx': ExcelWriter
+}
+
+def create_writer(output_file, run_name, offset=None):
+	'''
+	:param offset: bytes written before a checkpoint, when resuming a run
+	'''
+
+	extension = os.path.splitext(output_file)[1].lower()
+	if extension not in writer_mapping:
+		raise ValueError(f'Unsupported output format: {extension}, use one of {", ".join(writer_mapping)}')
+	return writer_mapping[extension](output_file, run_name, offset)
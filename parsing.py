@@ -0,0 +1,158 @@
+import re
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+_quote_mapping = {'”': '"', '“': '"', '’': "'", '‘': "'"}
+_key_pattern = re.compile(r'\s*([A-Za-z_]\w*)\s*:\s*')
+_number_pattern = re.compile(r'-?\d+(\.\d+)?')
+_string_pattern = re.compile(r'\'([^\']*)\'|"([^"]*)"')
+_datetime_pattern = re.compile(r'datetime\s*\(\s*(\'[^\']*\'|"[^"]*")\s*\)')
+
+def normalise_quotes(text):
+	for old, new in _quote_mapping.items():
+		text = text.replace(old, new)
+	return text
+
+_timestamp_formats = ['%Y-%m-%dT%H:%M:%S.%f%z', '%Y-%m-%dT%H:%M:%S%z', '%Y-%m-%d %H:%M:%S.%f%z', '%Y-%m-%d %H:%M:%S%z']
+
+def parse_timestamp(value):
+	'''
+	parses an ISO 8601 timestamp, e.g. 2019-06-27T09:39:10.508+08:00, a timestamp without an offset is taken as UTC
+	fromisoformat handles the exported formats directly, strptime is only the fallback for other layouts
+	:return: timezone aware datetime, or None when the value is malformed
+	'''
+
+	try:
+		parsed = datetime.fromisoformat(value)
+	except ValueError:
+		parsed = _parse_layouts(value)
+	if parsed is not None and parsed.tzinfo is None:
+		parsed = parsed.replace(tzinfo=timezone.utc)
+	return parsed
+
+def _parse_layouts(value):
+	value = value.strip().replace('Z', '+0000')
+	if len(value) > 6 and value[-3] == ':' and value[-6] in '+-':
+		value = value[:-3] + value[-2:]
+	for timestamp_format in _timestamp_formats:
+		try:
+			return datetime.strptime(value, timestamp_format)
+		except ValueError:
+			continue
+	return None
+
+def parse_timestamps(values):
+	# parses a batch of timestamps, repeated values are only parsed once
+	parsed = {}
+	return [parsed[value] if value in parsed else parsed.setdefault(value, parse_timestamp(value)) for value in values]
+
+@lru_cache(maxsize=4096)
+def parse_datetime(value):
+	'''
+	parses a schedule datetime, cypher's datetime() defaults to UTC when no offset is given
+	schedules repeat the same few times, so results are cached
+	'''
+
+	parsed = parse_timestamp(value)
+	if parsed is None:
+		raise ValueError(f'Invalid datetime: {value}')
+	return parsed
+
+_duration_pattern = re.compile(r'P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?')
+
+@lru_cache(maxsize=64)
+def parse_duration(value):
+	'''
+	parses an ISO 8601 duration of weeks, days, hours, minutes & seconds, e.g. P1D or PT12H
+	:return: timedelta, raises ValueError when the value is malformed or zero
+	'''
+
+	match = _duration_pattern.fullmatch(value.strip())
+	if not match:
+		raise ValueError(f'Invalid duration: {value}')
+	weeks, days, hours, minutes, seconds = (int(group) if group else 0 for group in match.groups())
+	duration = timedelta(weeks=weeks, days=days, hours=hours, minutes=minutes, seconds=seconds)
+	if not duration:
+		raise ValueError(f'Invalid duration: {value}')
+	return duration
+
+def _skip_spaces(text, pos):
+	while pos < len(text) and text[pos].isspace():
+		pos += 1
+	return pos
+
+def _parse_value(text, pos):
+	pos = _skip_spaces(text, pos)
+	if text[pos] == '[':
+		values = []
+		pos = _skip_spaces(text, pos + 1)
+		while text[pos] != ']':
+			value, pos = _parse_value(text, pos)
+			values.append(value)
+			pos = _skip_spaces(text, pos)
+			if text[pos] == ',':
+				pos += 1
+			pos = _skip_spaces(text, pos)
+		return values, pos + 1
+
+	match = _string_pattern.match(text, pos)
+	if match:
+		return match.group(1) if match.group(1) is not None else match.group(2), match.end()
+
+	match = _datetime_pattern.match(text, pos)
+	if match:
+		return parse_datetime(match.group(1)[1:-1]), match.end()
+
+	for literal, value in (('true', True), ('false', False), ('null', None)):
+		if text.startswith(literal, pos):
+			return value, pos + len(literal)
+
+	match = _number_pattern.match(text, pos)
+	if match:
+		number = match.group(0)
+		return float(number) if match.group(1) else int(number), match.end()
+
+	raise ValueError(f'Unable to parse property value at: {text[pos:pos + 20]}')
+
+def parse_properties(text):
+	'''
+	parses the body of a cypher map literal, as written in the graph workbook, into a dict
+	e.g. "cost: 20, via: 'Kerry', startDate: datetime('2019-08-23T08:00')"
+	:return: {'cost': 20, 'via': 'Kerry', 'startDate': datetime(2019, 8, 23, 8, 0, tzinfo=utc)}
+	'''
+
+	properties = {}
+	if not text:
+		return properties
+	text = normalise_quotes(text).strip().strip(',')
+	pos = 0
+	while pos < len(text):
+		match = _key_pattern.match(text, pos)
+		if not match:
+			raise ValueError(f'Unable to parse property key at: {text[pos:pos + 20]}')
+		properties[match.group(1)], pos = _parse_value(text, match.end())
+		pos = _skip_spaces(text, pos)
+		if pos < len(text) and text[pos] == ',':
+			pos += 1
+	return properties
+
+def _format_value(value):
+	if isinstance(value, bool):
+		return 'true' if value else 'false'
+	if value is None:
+		return 'null'
+	if isinstance(value, datetime):
+		return f"datetime('{value.isoformat()}')"
+	if isinstance(value, (list, tuple)):
+		return '[' + ', '.join(_format_value(v) for v in value) + ']'
+	if isinstance(value, str):
+		return f"'{value}'"
+	return str(value)
+
+def format_properties(properties):
+	'''
+	writes a dict as the body of a cypher map literal, the inverse of parse_properties
+	:return: e.g. "cost: 20, via: 'Kerry', startDate: datetime('2019-08-23T08:00:00+00:00')"
+	'''
+
+	return ', '.join(f'{key}: {_format_value(value)}' for key, value in properties.items())
@@ -0,0 +1,132 @@
+from collections import Counter, deque
+
+import numpy as np
+
+# stands in for the payment types & merchants no link names, it never equals a link's property
+_other = object()
+
+class ReachabilityIndex:
+	"""
+	answers whether filter_graph can find any path for an order without running it
+	filter_graph keeps paths of at most 15 links from the origin to the destination coverage area where any link
+	accepts the order's payment type & merchant, so reachability depends on the origin and on the order's class:
+	its payment type, if any link names it, and its merchant, if any link restricts it, others behave alike
+	the coverage areas reachable for an origin & class are found with one breadth first search over node to node
+	bundles the first time they are asked for, every later order of that origin & class is answered by a set lookup
+	link timings play no part, so expiring a link leaves the index as it is
+	"""
+
+	max_hops = 15
+
+	def __init__(self, nodes):
+		self._labels = dict(nodes)
+		self._out = {}
+		self._payment_types = set()
+		self._merchants = set()
+		self._reachable = {}
+		self.rejected = 0
+
+	@classmethod
+	def from_records(cls, nodes, links):
+		index = cls((node['name'], node['label']) for node in nodes)
+		for link in links:
+			if link['link'] == 'CONNECTED_TO':
+				index.add_link(link['node1'], link['node2'], link['properties'])
+		return index
+
+	@classmethod
+	def from_snapshot(cls, snapshot):
+		# links of a bundle sharing their property set share their acceptance, so only distinct triples are read
+		index = cls((node['name'], node['label']) for node in snapshot.nodes)
+		connected = [i for i, link_type in enumerate(snapshot.types) if link_type == 'CONNECTED_TO']
+		keep = np.isin(snapshot.type, connected)
+		rows = np.stack([snapshot.src[keep], snapshot.dst[keep], snapshot.extra[keep]], axis=1) if keep.any() else []
+		for src, dst, extra in (np.unique(rows, axis=0).tolist() if len(rows) else []):
+			index.add_link(snapshot.names[src], snapshot.names[dst], snapshot.extras[extra])
+		return index
+
+	@staticmethod
+	def _profile(properties):
+		# the properties the cypher predicate reads, a missing restrictedMerchants never accepts
+		restricted = properties.get('restrictedMerchants')
+		return properties.get('paymentType'), tuple(restricted) if restricted is not None else None
+
+	def add_link(self, from_node, to_node, properties):
+		'''
+		adds a link, results cached for origins that reached its start node are dropped as they may grow
+		'''
+
+		profile = self._profile(properties)
+		self._out.setdefault(from_node, {}).setdefault(to_node, Counter())[profile] += 1
+		self._payment_types.add(profile[0])
+		self._merchants.update(profile[1] or ())
+		self._drop(from_node)
+
+	def remove_link(self, from_node, to_node, properties):
+		# a bundle keeps accepting while another of its links shares the removed link's properties
+		profiles = self._out.get(from_node, {}).get(to_node)
+		profile = self._profile(properties)
+		if not profiles or not profiles[profile]:
+			return
+		profiles[profile] -= 1
+		if not profiles[profile]:
+			del profiles[profile]
+		if not profiles:
+			# the last link between the nodes is gone, so the search must not pass between them anymore
+			del self._out[from_node][to_node]
+		self._drop(from_node)
+
+	def _drop(self, node):
+		for key in [key for key, reached in self._reachable.items() if node in reached[0]]:
+			del self._reachable[key]
+
+	def _order_class(self, order_details):
+		payment_type = order_details['payment_type'] if order_details['payment_type'] in self._payment_types else _other
+		merchant = order_details['agent_app'] if order_details['agent_app'] in self._merchants else _other
+		return payment_type, merchant
+
+	@staticmethod
+	def _accepts(profile, payment_type, merchant):
+		return profile[0] in ['Both', payment_type] and profile[1] is not None and merchant not in profile[1]
+
+	def _search(self, origin, payment_type, merchant):
+		'''
+		breadth first search over (node, passed an accepting link) states, like MemoryHandler._hop_distances
+		:return: (every node reached, coverage areas reached over an accepting link)
+		'''
+
+		seen = {(origin, False)}
+		queue = deque([(origin, False, 0)])
+		while queue:
+			node, allowed, hops = queue.popleft()
+			if hops == self.max_hops:
+				continue
+			for nbr, profiles in self._out.get(node, {}).items():
+				nbr_allowed = allowed or any(self._accepts(profile, payment_type, merchant) for profile in profiles)
+				if (nbr, nbr_allowed) not in seen:
+					seen.add((nbr, nbr_allowed))
+					queue.append((nbr, nbr_allowed, hops + 1))
+		nodes = {node for node, _ in seen}
+		destinations = {node for node, allowed in seen if allowed and self._labels.get(node) == 'COVERAGEAREA'}
+		return nodes, destinations
+
+	def reachable(self, order_details):
+		'''
+		:return: False when filter_graph would find no path for the order
+		'''
+
+		origin = order_details['origin_zone']
+		label = order_details.get('start_label') or 'COVERAGEAREA'
+		if self._labels.get(origin) != label:
+			return False
+		key = (origin,) + self._order_class(order_details)
+		reached = self._reachable.get(key)
+		if reached is None:
+			reached = self._search(origin, *key[1:])
+			self._reachable[key] = reached
+		if order_details['destination_zone'] is None:
+			return bool(reached[1])
+		return order_details['destination_zone'] in reached[1]
+
+	def stats(self):
+		return {'classes_searched': len(self._reachable), 'rejected': self.rejected}
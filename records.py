@@ -0,0 +1,112 @@
+import weakref
+
+class Link:
+	"""
+	a scheduled link on an order's path
+	the link data is the graph's own property dict, shared rather than copied
+	"""
+
+	__slots__ = ('from_node', 'from_label', 'to_node', 'to_label', 'data')
+
+	def __init__(self, from_node, from_label, to_node, to_label, data):
+		self.from_node = from_node
+		self.from_label = from_label
+		self.to_node = to_node
+		self.to_label = to_label
+		self.data = data
+
+	def __repr__(self):
+		return f'Link({self.from_node} -> {self.to_node}, {self.data.get("startDate")})'
+
+_descriptions = {
+	'create': lambda kwargs: f'Create order: {kwargs["tracking_no"]}, {kwargs["origin_zone"]} --> {kwargs["destination_zone"]}',
+	'leave': lambda kwargs: f'Leave node: {kwargs["link"].from_node}',
+	'expire': lambda kwargs: (
+		f'Expire link: ({kwargs["link"].from_node}) -> ({kwargs["link"].to_node}) at {str(kwargs["link"].data["startDate"])}'
+	),
+	'arrive': lambda kwargs: f'Arrive node: {kwargs["link"].to_node}',
+	'deliver': lambda kwargs: f'Order {kwargs["tracking_no"]} delivered to {kwargs["link"].to_node}'
+}
+
+class Event:
+	"""
+	a timeline entry, the actions it runs are looked up by type in the simulator's action table
+	descriptions are only formatted when asked for, i.e. when events are printed
+	"""
+
+	__slots__ = ('datetime', 'type', 'kwargs')
+
+	def __init__(self, datetime, type, kwargs):
+		self.datetime = datetime
+		self.type = type
+		self.kwargs = kwargs
+
+	@property
+	def desc(self):
+		return _descriptions[self.type](self.kwargs)
+
+	def __repr__(self):
+		return f'Event({self.type}, {self.datetime})'
+
+class Route:
+	"""
+	an interned path, shared by every order planned over the same links
+	links run from the end node back, as find_path returns them, the path shown in results is rendered once
+	"""
+
+	__slots__ = ('links', 'end_node', '_path', '__weakref__')
+
+	def __init__(self, links):
+		self.links = tuple(links)
+		self.end_node = self.links[0].to_node
+		self._path = None
+
+	@property
+	def path(self):
+		if self._path is None:
+			hops = [f'({link.from_node}) > [{link.data["operatedBy"]}]' for link in reversed(self.links)]
+			self._path = ' > '.join(hops + [f'({self.end_node})'])
+		return self._path
+
+	def __repr__(self):
+		return f'Route({self.path})'
+
+class RouteTable:
+	"""
+	interns routes by the identity of their links' data, which every search over the same sub graph shares
+	a route is only kept while an order or event still refers to it
+	"""
+
+	def __init__(self):
+		self._routes = weakref.WeakValueDictionary()
+		self.lookups = 0
+		self.hits = 0
+
+	def intern(self, links):
+		self.lookups += 1
+		key = tuple((link.from_node, link.to_node, id(link.data)) for link in links)
+		route = self._routes.get(key)
+		if route is None:
+			route = Route(links)
+			self._routes[key] = route
+		else:
+			self.hits += 1
+		return route
+
+	def stats(self):
+		return {'routes': len(self._routes), 'lookups': self.lookups, 'hits': self.hits}
+
+class InFlightOrder:
+	"""
+	what reach_node needs of an order between its creation and delivery
+	the hubs of its sub graph are kept, the sub graph itself is only looked up again by its cache key when a re-plan runs
+	"""
+
+	__slots__ = ('route', 'payment_type', 'agent_app', 'graph_key', 'hubs')
+
+	def __init__(self, route, payment_type, agent_app, graph_key, hubs):
+		self.route = route
+		self.payment_type = payment_type
+		self.agent_app = agent_app
+		self.graph_key = graph_key
+		self.hubs = hubs
@@ -1,4 +1,5 @@
 import argparse
+import os
 
 from simulator import Simulator
 
@@ -6,8 +7,17 @@ parser = argparse.ArgumentParser(description='CLI for Network-Partner Routing Si
 
 parser.add_argument('graph', metavar='graph_file', type=str, help='File name of graph excel file')
 parser.add_argument('order', metavar='order_file', type=str, help='File name of order data csv file')
-parser.add_argument('-output', metavar='output_file', type=str, help='File name of output excel file')
+parser.add_argument('-output', metavar='output_file', type=str, help='File name of output file, .xlsx, .csv or .jsonl')
 parser.add_argument('-config', metavar='config', type=str, help='Optional configurations')
+parser.add_argument('-cache', metavar='cache_size', type=int, help='Number of filtered sub graphs kept in memory')
+parser.add_argument('-workers', metavar='workers', type=int, help='Worker processes routing orders in STATIC mode, when every link recurs')
+parser.add_argument('-batch', metavar='batch_window', type=int, help='Minutes of order creation routed together as one wave in STATIC mode')
+parser.add_argument('-window', metavar='flush_window', type=int, help='Minutes of simulated time between batched db writes')
+parser.add_argument('-checkpoint', metavar='checkpoint_events', type=int, help='Events between checkpoints of the run')
+parser.add_argument('-checkpoint_hours', metavar='checkpoint_hours', type=float, help='Simulated hours between checkpoints of the run')
+parser.add_argument('-seed', metavar='seed', type=int, help='Seed for the delays drawn in DYNAMIC mode')
+parser.add_argument('-delays', metavar='delay_file', type=str, help='Json file of delay weights, for the network and per partner')
+parser.add_argument('-resume', action='store_true', help='Continue from the checkpoint next to the output file')
 
 args = parser.parse_args()
 
@@ -15,12 +25,38 @@ graph_file = args.graph
 order_file = args.order
 optional_args = {'output_file': 'output.xlsx', 'cost_factor': 'time'}
 config_mapping = {
+	'a': ('async_io', True),
+	'c': ('congestion', True),
 	'd': ('algo', 'DYNAMIC'),
+	'f': ('incremental', False),
 	'k': ('clear_graph', False),
-	'p': ('cost_factor', 'cost')
+	'm': ('backend', 'MEMORY'),
+	'p': ('cost_factor', 'cost'),
+	'r': ('recurrence', 'P1D'),
+	't': ('profile', True),
+	'v': ('verbose', True)
 }
 if args.output:
-	optional_args['output_file'] = f'{args.output}.xlsx'
+	# the extension picks the output format, xlsx when none is given
+	optional_args['output_file'] = args.output if os.path.splitext(args.output)[1] else f'{args.output}.xlsx'
+if args.window is not None:
+	optional_args['flush_window'] = args.window
+if args.batch is not None:
+	optional_args['batch_window'] = args.batch
+if args.cache is not None:
+	optional_args['cache_size'] = args.cache
+if args.workers is not None:
+	optional_args['workers'] = args.workers
+if args.checkpoint is not None:
+	optional_args['checkpoint_events'] = args.checkpoint
+if args.checkpoint_hours is not None:
+	optional_args['checkpoint_hours'] = args.checkpoint_hours
+if args.seed is not None:
+	optional_args['seed'] = args.seed
+if args.delays:
+	optional_args['delay_file'] = args.delays
+if args.resume:
+	optional_args['resume'] = True
 configs = args.config if args.config else ''
 for k in config_mapping.keys():
 	if k in configs:
@@ -1,193 +1,506 @@
+import asyncio
+import cProfile
 import csv
-import random
+import json
+import os
+import resource
+import signal
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice, takewhile
+from multiprocessing import Pool
 from datetime import datetime, timedelta
-import re
 
-import networkx as nx
+import numpy as np
 
-from openpyxl import load_workbook, Workbook
-
-from graph import find_path
+from batch_router import route_batch
+from cache import SubgraphCache
+from capacity import LoadIndex
+from checkpoint import Checkpointer
+from graph import accepts_order, find_path, get_heuristic, get_hubs, path_cost
 from db_handler import DBHandler
+from delay import DelayModel
+from instrumentation import Instrumentation
+from memory_handler import MemoryHandler
+from output import create_writer
+from parsing import parse_timestamps
+from reachability import ReachabilityIndex
+from records import Event, InFlightOrder, RouteTable
+from snapshot import Snapshot, SnapshotHandler, apply_recurrence, load_network, snapshot_is_fresh, snapshot_path
+from timeline import Timeline
+
+def _create_handler(backend):
+	return MemoryHandler() if backend == 'MEMORY' else DBHandler()
+
+def _load_handler(backend, network, recurrence=None):
+	# network is the path of a snapshot the memory backend maps directly, or the nodes & links to build a graph from
+	if isinstance(network, str):
+		return SnapshotHandler(network, recurrence)
+	handler = _create_handler(backend)
+	if backend == 'MEMORY':
+		handler.build_graph(*network, clear_graph=True)
+	return handler
+
+_worker = {}
+
+def _init_worker(backend, network, cost_factor, cache_size, recurrence):
+	# each worker process routes against its own handler, so no graph state is shared, snapshots are mapped read only
+	# interrupts are left to the main process, which checkpoints the run
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+	_worker['handler'] = _load_handler(backend, network, recurrence)
+	_worker['cache'] = SubgraphCache(cache_size)
+	_worker['cost_factor'] = cost_factor
+
+def _route_order(order_details):
+	handler = _worker['handler']
+	cache = _worker['cache']
+	key = cache.key(order_details)
+	found, g = cache.get(key)
+	if not found:
+		sub_graph = handler.filter_graph(order_details)
+		g = handler.to_networkx(sub_graph) if sub_graph else None
+		cache.put(key, g)
+	links, cost = find_path(g, order_details, _worker['cost_factor']) if g else ([], None)
+	return order_details['tracking_no'], links, cost
+
+order_fields = ['tracking_no', 'created_on', 'payment_type', 'origin_zone', 'destination_zone', 'agent_application_name']
+
+def _order_details(order, created_on, row=None):
+	return {
+		'row': row,
+		'tracking_no': order['tracking_no'],
+		'created_on': created_on,
+		'agent_app': order['agent_application_name'],
+		'payment_type': order['payment_type'],
+		'origin_zone': order['origin_zone'],
+		'destination_zone': order['destination_zone']
+	}
+
+def _order_headers(header_row):
+	headers = [header.lower().replace(' ', '_') for header in header_row]
+	missing = [field for field in order_fields if field not in headers]
+	if missing:
+		raise ValueError(f'Order file is missing columns: {", ".join(missing)}')
+	return headers
+
+def orders_sorted(orders_file):
+	'''
+	scans the created on column, orders are only streamed from a file sorted by it
+	:return: False when a row was created before a row above it, malformed rows are ignored
+	'''
+
+	with open(f'{orders_file}.csv') as orders:
+		reader = csv.reader(orders)
+		created_on_column = _order_headers(next(reader)).index('created_on')
+		latest = None
+		for rows in iter(lambda: list(islice(reader, 1000)), []):
+			for created_on in parse_timestamps([row[created_on_column] for row in rows]):
+				if created_on is None:
+					continue
+				if latest is not None and created_on < latest:
+					return False
+				latest = created_on
+	return True
+
+def read_orders(orders_file, counts, start_row=0):
+	'''
+	reads the orders file lazily, only keeping the columns the simulator uses
+	headers are normalised once, rows are yielded as order details
+	:param counts: Counter of the rows read & skipped, updated as the stream is consumed
+	:param start_row: rows before it are counted but not yielded, when resuming from a checkpoint
+	'''
+
+	with open(f'{orders_file}.csv') as orders:
+		reader = csv.reader(orders)
+		headers = _order_headers(next(reader))
+		columns = [(field, headers.index(field)) for field in order_fields]
+		created_on_column = headers.index('created_on')
+		for rows in iter(lambda: list(islice(reader, 1000)), []):
+			# timestamps are parsed a chunk at a time, malformed rows are skipped
+			for row, created_on in zip(rows, parse_timestamps([row[created_on_column] for row in rows])):
+				counts['read'] += 1
+				if created_on is None:
+					counts['skipped'] += 1
+					continue
+				if counts['read'] > start_row:
+					yield _order_details({field: row[i] for field, i in columns}, created_on, counts['read'] - 1)
+
+def load_orders(orders_file):
+	'''
+	reads the whole orders file sorted by created on, rows created at the same time keep their order in the file
+	for runs sharing one copy of the orders, and for files too unsorted to stream
+	:return: (order details, Counter of the rows read & skipped)
+	'''
+
+	counts = Counter()
+	return sorted(read_orders(orders_file, counts), key=lambda order: order['created_on']), counts
 
 class Simulator:
 
-	results = []
-	timeline = []
-	all_orders = {}
+	def __init__(
+			self, graph_file, orders_file, output_file, cost_factor='time', algo='STATIC', clear_graph=True,
+			backend='NEO4J', flush_window=60, cache_size=256, workers=1, verbose=False, profile=False,
+			recurrence=None, incremental=True, congestion=False, batch_window=None, checkpoint_events=None,
+			checkpoint_hours=None, resume=False, seed=None, delay_file=None, async_io=False, io_threads=8,
+			network=None, orders=None
+	):
+		'''
+		:param network: graph loaded beforehand, nodes & links records or a snapshot path, the graph file is not read
+		:param orders: orders loaded beforehand with load_orders, the orders file is not read
+		'''
 
-	def __init__(self, graph_file, orders_file, output_file, cost_factor='time', algo='STATIC', clear_graph=True):
 		self.dynamic = algo != 'STATIC'
+		# an unseeded run draws its own seed and reports it, so any run can be repeated
+		seed = seed if seed is not None else int(np.random.SeedSequence().entropy % 2 ** 32)
 		self.output_file = output_file
 		print(
 			'###############################\n'
 			'### JANIO ROUTING SIMULATOR ###\n'
 			'###############################\n'
 			f'\nCONFIGURATIONS:\nGraph File:  {graph_file}\nOrder File:  {orders_file}.csv\nOutput File: {self.output_file}\n'
-			f'\nADDITIONAL CONFIGURATIONS\nAlgo: {algo}\nClear graph: {clear_graph}'
+			f'\nADDITIONAL CONFIGURATIONS\nAlgo: {algo}\nClear graph: {clear_graph}\nBackend: {backend}\nWorkers: {workers}'
+			f'\nVerbose: {verbose}\nProfile: {profile}\nRecurrence: {recurrence}\nIncremental: {incremental}\nCongestion: {congestion}\nBatch window: {batch_window}'
+			f'\nCheckpoint every: {checkpoint_events} events, {checkpoint_hours} hours\nResume: {resume}'
+			f'\nSeed: {seed}\nDelay file: {delay_file}\nAsync IO: {async_io}'
 		)
 		self.cost_factor = cost_factor
+		self.timeline = Timeline()
+		self.flush_window = timedelta(minutes=flush_window)
+		self.writes = 0
+		self.flushes = 0
+		self.cache = SubgraphCache(cache_size)
+		self.backend = backend
+		self.workers = workers
+		self.routes = {}
+		self.all_orders = {}
+		self.route_table = RouteTable()
+		self.graph_keys = {}
+		self.writer = None
+		self.results_written = 0
 		self.sheet_name = datetime.now().strftime("%d-%m T%H-%M-%S") + f'({cost_factor})'
-		self.handler = DBHandler()
-		self.orders = self._load_orders(orders_file)
-		self._build_graph(graph_file, clear_graph)
+		self.handler = _create_handler(backend)
+		self.orders_file = orders_file
+		self.orders = orders
+		self.order_counts = Counter()
+		self.clock = None
+		self.window_end = None
+		self.verbose = verbose
+		self.recurrence = recurrence
+		self.incremental = incremental
+		self.congestion = congestion
+		self.load = LoadIndex()
+		self.reachability = None
+		self.delay_model = DelayModel.from_file(delay_file, seed) if delay_file else DelayModel(seed=seed)
+		self.batch_window = timedelta(minutes=batch_window) if batch_window is not None else None
+		self.profile = profile
+		self.stats = Instrumentation()
+		self.actions = self._action_table()
+		self.checkpointer = Checkpointer(
+			f'{os.path.splitext(output_file)[0]}.checkpoint', checkpoint_events, checkpoint_hours
+		)
+		self.resume = resume
+		self.async_io = async_io
+		self.io_threads = io_threads
+		self.events_per_second = None
+		self._interrupted = False
+		with self.stats.timer('graph_build'):
+			self._build_graph(graph_file, clear_graph, network)
 
 	### SETUP ###
 
-	def _load_orders(self, orders_file):
-		orders_list = []
-		with open(f'{orders_file}.csv') as orders:
-			reader = csv.DictReader(orders)
-			for row in reader:
-				order_data = {}
-				for key,val in row.items():
-					order_data[key.lower().replace(' ', '_')] = val
-				orders_list.append(order_data)
-		print(f'ORDERS LOADED: {len(orders_list)}\n')
-		return orders_list
+	def _stream_orders(self, orders_file, start=None):
+		'''
+		the orders by created on, as the timeline has to get them, a sorted file is streamed
+		an unsorted one is loaded whole & sorted, like preloaded orders, their counts are those read from the file
+		:param start: (row, (created on, row)) of the next order when resuming, its key is None once every order was added
+		'''
+
+		next_row, next_key = start or (0, None)
+		orders = self.orders
+		if orders is None:
+			if orders_sorted(orders_file):
+				return read_orders(orders_file, self.order_counts, next_row)
+			print(f'WARNING: {orders_file}.csv is not sorted by created on, it is loaded whole and sorted instead of streamed')
+			orders = load_orders(orders_file)
+		orders, counts = orders
+		self.order_counts.update(counts)
+		if start is None:
+			return iter(orders)
+		return (order for order in orders if next_key is not None and (order['created_on'], order['row']) >= next_key)
+
+	@property
+	def orders_read(self):
+		return self.order_counts['read']
+
+	@property
+	def skipped_orders(self):
+		return self.order_counts['skipped']
 
 	def _finish(self):
 		self.handler.finish()
 
-	def _build_graph(self, graph_file, clear_graph):
-		workbook = load_workbook(f'{graph_file}.xlsx')
-		node_sheet = workbook['nodes']
-		nodes = []
-		link_sheet = workbook['links']
-		links = []
-
-		for row in node_sheet.iter_rows(min_row=2, values_only=True):
-			attr = {'name': f'"{row[0]}"', 'label': row[1]}
-			if row[2]:
-				attr['attr'] = f', {row[2]}'
-			nodes.append(attr)
-
-		for row in link_sheet.iter_rows(min_row=2, values_only=True):
-			start = re.search("startDate:datetime\((.*?)\),endDate", row[3].replace(' ', '')).group(1)[1:-1]
-			end = re.search("endDate:datetime\((.*?)\),", row[3].replace(' ', '')).group(1)[1:-1]
-			for i in range(1):
-				start_date = datetime.strptime(start, '%Y-%m-%dT%H:%M') + timedelta(days=i)
-				end_date = datetime.strptime(end, '%Y-%m-%dT%H:%M') + timedelta(days=i)
-				start_str = start_date.strftime('%Y-%m-%dT%H:%M')
-				end_str = end_date.strftime('%Y-%m-%dT%H:%M')
-				new = re.sub("startDate:datetime\((.*?)\),endDate", f"startDate:datetime('{start_str}'),endDate",
-										 row[3].replace(' ', ''))
-				new = re.sub("endDate:datetime\((.*?)\),", f"endDate:datetime('{end_str}'),", new.replace(' ', ''))
-
-				attr = {
-					'node1': f'"{row[0]}"',
-					'node1_label': row[1],
-					'link': row[2],
-					'node2': f'"{row[4]}"',
-					'node2_label': row[5],
-					'attr': new + ', order_count: []'
-				}
-				links.append(attr)
-
-		self.handler.build_graph(nodes, links, clear_graph)
-
-	def _output_result(self):
-		try:
-			workbook = load_workbook(self.output_file)
-			sheet = workbook.create_sheet(self.sheet_name)
-		except:
-			workbook = Workbook()
-			sheet = workbook.active
-			sheet.title = self.sheet_name
-		finally:
-			sheet.append(list(self.results[0].keys()))
-			results_sorted = sorted(self.results, key=lambda i: i['tracking_no'])
-			for result in results_sorted:
-				sheet.append(list(result.values()))
-
-			orders = {}
-			for row in sheet.iter_rows(min_row=1,max_col=1):
-				cell = row[0]
-				if orders.get(cell.value):
-					orders[cell.value].append(cell.coordinate)
-				else:
-					orders[cell.value] = [cell.coordinate]
-
-			for k, v in orders.items():
-				if len(v) > 1:
-					sheet.merge_cells(f'{v[0]}:{v[-1]}')
-			workbook.save(self.output_file)
-
-	def _delay_arrival(self, initial_arrival):
-		delay_weights = {
-			0: 50,
-			0.5: 20,
-			1: 15,
-			3: 10,
-			5: 5
-		}
-		ls = []
-		for delay, prob in delay_weights.items():
-			ls += [delay] * prob
-		delay = random.choice(ls)
+	def _build_graph(self, graph_file, clear_graph, network=None):
+		'''
+		the memory backend maps a compiled snapshot of the graph when there is one up to date, see snapshot.py
+		otherwise the graph is read from its snapshot or workbook and built in the handler
+		'''
+
+		if network is None and os.path.exists(snapshot_path(graph_file)) and not snapshot_is_fresh(graph_file):
+			print(f'WARNING: {snapshot_path(graph_file)} is older than {graph_file}.xlsx and is ignored')
+		if network is None and self.backend == 'MEMORY' and snapshot_is_fresh(graph_file):
+			network = snapshot_path(graph_file)
+		if isinstance(network, str) and self.backend == 'MEMORY':
+			self.network = network
+			if not self.resume:
+				self.handler = _load_handler(self.backend, self.network, self.recurrence)
+			with self.stats.timer('reachability'):
+				self.reachability = ReachabilityIndex.from_snapshot(Snapshot(self.network))
+			return
+
+		if isinstance(network, str):
+			network = Snapshot(network).records()
+		# the handlers copy link properties as they build, so runs sharing loaded records never share link state
+		self.network = apply_recurrence(*network, self.recurrence) if network else load_network(graph_file, self.recurrence)
+		if not self.resume:
+			# a resumed run takes the graph from its checkpoint, or the db as it was left
+			self.handler.build_graph(*self.network, clear_graph)
+		# a kept db may hold links the workbook does not, orders are then left to filter_graph
+		if clear_graph or self.backend == 'MEMORY':
+			with self.stats.timer('reachability'):
+				self.reachability = ReachabilityIndex.from_records(*self.network)
+
+	def _add_result(self, result):
+		# results are written out as soon as they are known, nothing is kept in memory
+		with self.stats.timer('output'):
+			self.writer.write(result)
+		self.results_written += 1
+
+	def _delay_arrival(self, initial_arrival, link_data):
+		delay = self.delay_model.sample(link_data)
 		return initial_arrival + timedelta(hours=delay), delay
 
-	def _get_actions(self, event_type):
-		action_mapping = {
-			'create': [self.create_order, self.increment_order_count],
-			'arrive': [],
-			'leave': [self.decrement_order_count],
-			'expire': [self.expire_link],
-			'deliver': [self.order_delivered]
+	def _action_table(self):
+		# actions run by each event type, built once and shared by every event
+		return {
+			'create': (self.create_order, self.increment_order_count),
+			'arrive': (self.insert_noise, self.reach_node) if self.dynamic else (),
+			'leave': (self.decrement_order_count,),
+			'expire': (self.expire_link,),
+			'deliver': (self.order_delivered,)
 		}
 
-		if self.dynamic and event_type == 'arrive':
-			return [self.insert_noise, self.reach_node]
-		else:
-			return action_mapping[event_type]
+	def _reachable(self, order_details):
+		# orders the index rules out are answered without running filter_graph
+		if self.reachability is None or self.reachability.reachable(order_details):
+			return True
+		self.reachability.rejected += 1
+		return False
+
+	def _get_graph(self, order_details):
+		# filter the network down to the links usable by the order and load them into networkx
+		key = self.cache.key(order_details)
+		found, g = self.cache.get(key)
+		if found:
+			return g
+
+		with self.stats.timer('filter_graph'):
+			sub_graph = self.handler.filter_graph(order_details)
+		with self.stats.timer('to_networkx'):
+			g = self.handler.to_networkx(sub_graph) if sub_graph else None
+		self.cache.put(key, g)
+		return g
+
+	def _find_path(self, g, order_details, heuristic=None):
+		if not g:
+			return [], None
+		with self.stats.timer('find_path'):
+			return find_path(g, order_details, self.cost_factor, heuristic, self.load if self.congestion else None)
+
+	def _replan(self, orders_dict, current_node, start_node, order_details):
+		'''
+		routes an order that arrived at current_node on from start_node
+		the rest of the plan is kept while the planned departure from current_node can still be caught
+		otherwise the order's own sub graph is searched again, guided by bounds towards the destination kept on the graph
+		:return: (links, cost), ([], None) when no path is found
+		'''
+
+		planned = orders_dict.route.links
+		departure = next((link for link in planned if link.from_node == current_node), None)
+		if self.incremental and departure is not None and departure.data['startDate'] > order_details['created_on']:
+			self.stats.count('replans.skipped')
+			remaining = list(takewhile(lambda link: link.to_node != start_node, planned))
+			return remaining, path_cost(remaining, order_details['created_on'], self.cost_factor)
+
+		self.stats.count('replans.run')
+		g = self._order_graph(orders_dict) if self.incremental else None
+		if g is not None:
+			return self._find_path(g, order_details, get_heuristic(g, order_details['destination_zone'], self.cost_factor))
+		if not self._reachable(order_details):
+			return [], None
+		return self._find_path(self._get_graph(order_details), order_details)
+
+	def _order_graph(self, orders_dict):
+		# the sub graph the order was routed on, loaded again if it has left the cache since
+		key = orders_dict.graph_key
+		return self._get_graph(dict(zip(['start_label', 'origin_zone', 'destination_zone', 'payment_type', 'agent_app'], key)))
+
+	def _add_no_path_result(self, tracking_no, order_details):
+		self._add_result(
+			{
+				'tracking_no': tracking_no,
+				'cost_factor': None,
+				'conditions': None,
+				'path': f'No path found: {order_details["origin_zone"]} - {order_details["destination_zone"]}.',
+				'cost': 0
+			}
+		)
+
+	def _has_expiring_links(self):
+		# one off links are moved a day once taken, only recurring links stay as the workers loaded them
+		if self.recurrence:
+			return False
+		if isinstance(self.network, str):
+			return any(not extra.get('recurrence') for extra in Snapshot(self.network).extras)
+		return any(not link['properties'].get('recurrence') for link in self.network[1])
+
+	def _route_ahead(self, orders, pool, chunk_size=1000):
+		'''
+		routes the order stream a chunk at a time in a pool of worker processes, each holding its own copy of the graph
+		orders are yielded once routed, so routes are ready before their create events run
+		only used in STATIC mode without congestion, where an order's route does not depend on other orders
+		workers see the graph as loaded, so it is only used when every link is recurring and none is ever moved
+		'''
+
+		chunk = []
+		for order in chain(orders, [None]):
+			if order is not None:
+				chunk.append(order)
+			if chunk and (order is None or len(chunk) == chunk_size):
+				# orders the reachability index rules out are not sent to the workers
+				for pending in chunk:
+					if pending['tracking_no'] not in self.routes and not self._reachable(pending):
+						self.routes[pending['tracking_no']] = ([], None)
+				with self.stats.timer('route_ahead'):
+					routed = pool.map(_route_order, [pending for pending in chunk if pending['tracking_no'] not in self.routes])
+				for tracking_no, links, cost in routed:
+					self.routes[tracking_no] = (links, cost)
+				yield from chunk
+				chunk = []
+
+	def _route_wave(self, wave):
+		'''
+		routes the orders of a wave sharing an origin, payment type & merchant with one search to every destination
+		each group leaves at its latest creation time, so every order in it can make the departures found
+		the search runs over every coverage area's sub graph, so a route is only kept if filter_graph would keep it for
+		the order's own destination: at most 15 links with one accepting the order, others are routed one at a time
+		'''
+
+		groups = {}
+		for order in wave:
+			if order['tracking_no'] in self.routes:
+				# routed before a checkpoint the run resumed from
+				continue
+			if not self._reachable(order):
+				self.routes[order['tracking_no']] = ([], None)
+				continue
+			groups.setdefault((order['origin_zone'], order['payment_type'], order['agent_app']), []).append(order)
+		for group in groups.values():
+			if len(group) == 1:
+				continue
+			start_time = max(order['created_on'] for order in group)
+			g = self._get_graph(dict(group[0], destination_zone=None, created_on=start_time))
+			if g is None:
+				continue
+			with self.stats.timer('route_batch'):
+				routed = route_batch(g, group[0]['origin_zone'], start_time, {order['destination_zone'] for order in group})
+			self.stats.count('batch.searches')
+			self.stats.count('batch.orders', len(group))
+			for order in group:
+				links = routed.get(order['destination_zone'], [])
+				if not links or len(links) > MemoryHandler.max_hops or not any(accepts_order(link.data, order) for link in links):
+					self.stats.count('batch.fallbacks')
+					continue
+				self.routes[order['tracking_no']] = (links, path_cost(links, order['created_on'], self.cost_factor))
+
+	def _route_waves(self, orders):
+		'''
+		splits the order stream into waves of orders created within the same batch window
+		windows are aligned to the clock, so a run resumed mid stream forms the same waves
+		orders are yielded once their wave is routed, so routes are ready before their create events run
+		only used in STATIC mode by time without congestion, where an order's route does not depend on other orders
+		'''
+
+		window = self.batch_window.total_seconds() or 1
+		wave = []
+		for order in chain(orders, [None]):
+			if wave and (order is None or order['created_on'].timestamp() // window != wave[0]['created_on'].timestamp() // window):
+				self._route_wave(wave)
+				yield from wave
+				wave = []
+			if order is not None:
+				wave.append(order)
+
+	def _prefetch_ahead(self, orders):
+		'''
+		reads the order stream a chunk at a time and loads the chunk's sub graphs into the cache concurrently,
+		on an asyncio loop over a pool of threads each holding its own db session
+		only the reads overlap, events still run one at a time in timeline order
+		filtering does not depend on link timings and cached graphs holding a link are dropped when it expires,
+		so a graph loaded ahead is the one the order would have loaded when created
+		'''
+
+		chunk_size = max(1, self.cache.max_size // 2)
+		loop = asyncio.new_event_loop()
+		try:
+			with ThreadPoolExecutor(self.io_threads) as executor:
+				chunk = []
+				for order in chain(orders, [None]):
+					if order is not None:
+						chunk.append(order)
+					if chunk and (order is None or len(chunk) == chunk_size):
+						loop.run_until_complete(self._load_graphs(loop, executor, chunk))
+						yield from chunk
+						chunk = []
+		finally:
+			loop.close()
+
+	async def _load_graphs(self, loop, executor, orders):
+		keys = {}
+		for order in orders:
+			key = self.cache.key(order)
+			if key not in self.cache and key not in keys:
+				keys[key] = order
+		if not keys:
+			return
+		# queued writes land first, so no thread flushes while the others read
+		self.flush_writes()
+		with self.stats.timer('prefetch'):
+			graphs = await asyncio.gather(*(loop.run_in_executor(executor, self._load_graph, order) for order in keys.values()))
+		for key, g in zip(keys, graphs):
+			self.cache.put(key, g)
+		self.stats.count('prefetch.graphs', len(keys))
+
+	def _load_graph(self, order_details):
+		sub_graph = self.handler.filter_graph(order_details)
+		return self.handler.to_networkx(sub_graph) if sub_graph else None
 
 	### TIMELINE ###
 
-	def add_event(self, new_event):
+	def add_event(self, event_type, event_datetime, kwargs):
 		'''
-		adds an event into the timeline, in a sorted order
-		event = {
-			datetime: time the event occurs
-			type: [create, arrive, leave, expire]
-			desc: description of the event (with some order specific data like tracking no)
-			kwargs: dictionary of keyword args to be passed into the pre stage
-		}
+		adds an event into the timeline, events with the same datetime run newest first
+		event_type: [create, arrive, leave, expire, deliver], picks the actions run from the action table
+		kwargs: dictionary of keyword args to be passed into the first action
 		:return:
 		'''
 
-		if len(self.timeline) == 0:
-			self.timeline.append(new_event)
-		else:
-			for i,event in enumerate(self.timeline):
-				if new_event['datetime'] <= event['datetime']:
-					self.timeline.insert(i, new_event)
-					return 0
+		self.timeline.push(Event(event_datetime, event_type, kwargs))
 
-			self.timeline.append(new_event)
-
-	def add_create_order_event(self, order):
+	def add_create_order_event(self, kwargs):
 		# add the create order event into the timeline
-		tracking_no = order['tracking_no']
-		created_datetime = order['created_on'][:-3] + order['created_on'][-2:]
-		created_on = datetime.strptime(created_datetime, '%Y-%m-%dT%H:%M:%S.%f%z')
-		origin = order['origin_zone']
-		destination = order['destination_zone']
-		kwargs = {
-			'tracking_no': tracking_no,
-			'created_on': created_on,
-			'agent_app': order['agent_application_name'],
-			'payment_type': order['payment_type'],
-			'origin_zone': origin,
-			'destination_zone': destination
-		}
-		event = {
-			'datetime': created_on,
-			'desc': f'Create order: {tracking_no}, {origin} --> {destination}',
-			'actions': self._get_actions('create'),
-			'kwargs': kwargs
-		}
-
-		self.add_event(event)
+		self.timeline.push(Event(kwargs['created_on'], 'create', kwargs), deferred=True)
 
 	def consume_event(self, event):
 		'''
@@ -195,14 +508,115 @@ class Simulator:
 		:return:
 		'''
 
-		kwargs = event['kwargs']
-		print(f'\nRun event: {kwargs["tracking_no"]}\n{event["desc"]}\n{str(event["datetime"])}')
-		for action in event['actions']:
+		kwargs = event.kwargs
+		self.stats.count(f'events.{event.type}')
+		if self.verbose:
+			print(f'\nRun event: {kwargs["tracking_no"]}\n{event.desc}\n{str(event.datetime)}')
+		for action in self.actions[event.type]:
 			kwargs = action(**kwargs)
 
-	def run_timeline(self):
-		while len(self.timeline) != 0:
-			self.consume_event(self.timeline.pop(0))
+	def flush_writes(self):
+		with self.stats.timer('db_write'):
+			writes = self.handler.flush()
+		if writes:
+			self.writes += writes
+			self.flushes += 1
+			if self.verbose:
+				print(f'\nFlushed {writes} writes in one transaction')
+
+	def _feed_orders(self, orders, next_order):
+		'''
+		adds create events from the order stream, sorted by created on, up to the datetime of the next event in the timeline
+		:return: the first order not yet added, None once the stream is exhausted
+		'''
+
+		while next_order is not None:
+			next_event = self.timeline.peek()
+			if next_event is not None and next_order['created_on'] > next_event:
+				break
+			self.add_create_order_event(next_order)
+			with self.stats.timer('order_load'):
+				next_order = next(orders, None)
+		return next_order
+
+	def run_timeline(self, orders=()):
+		# db writes are queued and flushed once per window of simulated time
+		orders = iter(orders)
+		with self.stats.timer('order_load'):
+			next_order = next(orders, None)
+		while True:
+			next_order = self._feed_orders(orders, next_order)
+			if len(self.timeline) == 0:
+				break
+			event = self.timeline.pop()
+			self.clock = event.datetime
+			if self.window_end is None or event.datetime >= self.window_end:
+				self.flush_writes()
+				self.window_end = event.datetime + self.flush_window
+			self.consume_event(event)
+			if self._interrupted:
+				self.save_checkpoint(next_order, wait=True)
+				raise KeyboardInterrupt
+			if self.checkpointer.due(self.timeline.processed, self.clock):
+				self.save_checkpoint(next_order)
+		self.flush_writes()
+
+	### CHECKPOINTS ###
+
+	def save_checkpoint(self, next_order, wait=False):
+		'''
+		snapshots everything a run needs to carry on after the last event consumed
+		the order stream is not saved, a resumed run reads it again from the row of the next order
+		the db is not part of the snapshot, pending writes are flushed so it is at least up to date with it
+		'''
+
+		if not isinstance(self.handler, MemoryHandler):
+			self.flush_writes()
+		state = {
+			'sheet_name': self.sheet_name,
+			'next_row': next_order['row'] if next_order is not None else self.orders_read,
+			'next_key': (next_order['created_on'], next_order['row']) if next_order is not None else None,
+			'output_offset': self.writer.offset(),
+			'clock': self.clock,
+			'window_end': self.window_end,
+			'timeline': self.timeline,
+			'all_orders': self.all_orders,
+			'routes': self.routes,
+			'cache': self.cache,
+			'load': self.load,
+			'handler': self.handler if isinstance(self.handler, MemoryHandler) else None,
+			'delay_model': self.delay_model,
+			'writes': self.writes,
+			'flushes': self.flushes,
+			'results_written': self.results_written,
+			'counters': self.stats.counters
+		}
+		with self.stats.timer('checkpoint'):
+			self.checkpointer.save(state, self.timeline.processed, self.clock, wait)
+
+	def _restore_checkpoint(self):
+		# :return: (row, key) of the next order of the stream, to resume reading from
+		if not os.path.exists(self.checkpointer.path):
+			raise ValueError(f'No checkpoint to resume from: {self.checkpointer.path}')
+		state = Checkpointer.load(self.checkpointer.path)
+		if state['handler'] is not None:
+			self.handler = state['handler']
+		else:
+			print('WARNING: the db is not rolled back, writes made after the checkpoint are kept')
+		for name in [
+			'sheet_name', 'clock', 'window_end', 'timeline', 'all_orders', 'routes', 'cache', 'load', 'delay_model',
+			'writes', 'flushes', 'results_written'
+		]:
+			setattr(self, name, state[name])
+		self.stats.counters.update(state['counters'])
+		self.writer = create_writer(self.output_file, self.sheet_name, state['output_offset'])
+		self.checkpointer.mark(self.timeline.processed, self.clock)
+		print(f'RESUMED: {self.checkpointer.path}, {self.timeline.processed} events processed')
+		return state['next_row'], state['next_key']
+
+	def _on_interrupt(self, signum, frame):
+		# the run stops after the event being consumed, once a checkpoint is written
+		self._interrupted = True
 
 	### ACTIONS ###
 
@@ -211,53 +625,42 @@ class Simulator:
 
 	def expire_link(self, **kwargs):
 
-		self.handler.expire_link(kwargs['link'])
+		with self.stats.timer('db_write'):
+			self.handler.expire_link(kwargs['link'])
+		self.cache.invalidate(kwargs['link'])
 
 	def create_order(self, **kwargs):
 		# load the sub graph
 		tracking_no = kwargs['tracking_no']
-		sub_graph = self.handler.filter_graph(kwargs)
-		if not sub_graph:
-			self.results.append(
-				{
-					'tracking_no': tracking_no,
-					'cost_factor': None,
-					'conditions': None,
-					'path': f'No path found: {kwargs["origin_zone"]} - {kwargs["destination_zone"]}.',
-					'cost': 0
-				}
-			)
+		g = None
+		if tracking_no in self.routes:
+			links, cost = self.routes.pop(tracking_no)
+		elif not self._reachable(kwargs):
+			links, cost = [], None
+		else:
+			g = self._get_graph(kwargs)
+			links, cost = self._find_path(g, kwargs)
+		if not links:
+			self._add_no_path_result(tracking_no, kwargs)
 			return {'links': [], 'tracking_no': tracking_no}
 
-		g = nx.MultiDiGraph()
-		for r in sub_graph.relationships:
-			from_node = r.nodes[0]
-			g.add_node(from_node['name'], label=list(from_node.labels)[0], **from_node._properties)
-			to_node = r.nodes[1]
-			g.add_node(to_node['name'], label=list(to_node.labels)[0], **to_node._properties)
-			g.add_edge(from_node['name'], to_node['name'], attr_dict=r._properties)
-
-		# find the path
-		links, cost = find_path(g, kwargs, self.cost_factor)
-		end_node = links[0][1][0]
-		order_path = {
-			'graph': g,
-			'links': links,
-			'payment_type': kwargs['payment_type'],
-			'agent_app': kwargs['agent_app']
-		}
-		self.all_orders.update({tracking_no: order_path})
-
-		path = f'({end_node})'
-		for link in links:
-			path = f'({link[0][0]}) > [{link[2]["operatedBy"]}] > ' + path
-
-		self.results.append(
+		# orders planned over the same links share one route, its links & rendered path
+		route = self.route_table.intern(links)
+		links = route.links
+		end_node = route.end_node
+		# orders of one class share their sub graph's cache key too
+		graph_key = self.cache.key(kwargs)
+		graph_key = self.graph_keys.setdefault(graph_key, graph_key)
+		# routes planned ahead come without a graph, they are only taken in STATIC mode where arrivals are not re-planned
+		hubs = get_hubs(g) if g is not None else frozenset()
+		self.all_orders[tracking_no] = InFlightOrder(route, kwargs['payment_type'], kwargs['agent_app'], graph_key, hubs)
+
+		self._add_result(
 			{
 				'tracking_no': tracking_no,
 				'cost_factor': self.cost_factor,
 				'conditions': None,
-				'path': path,
+				'path': route.path,
 				'cost': cost
 			}
 		)
@@ -266,32 +669,17 @@ class Simulator:
 				'link': link,
 				'tracking_no': tracking_no
 			}
-			from_node = link[0][0]
-			to_node = link[1][0]
-			leave_time = link[2]['startDate']
-
-			leave_event = {
-				'datetime': leave_time,
-				'desc': f'Leave node: {from_node}',
-				'actions': self._get_actions('leave'),
-				'kwargs': kwargs
-			}
-			self.add_event(leave_event)
-
-			self.add_event(
-				{
-					'datetime': leave_time + timedelta(minutes=30),
-					'desc': f'Expire link: ({from_node}) -> ({to_node}) at {str(leave_time)}',
-					'actions': self._get_actions('expire'),
-					'kwargs': kwargs
-				}
-			)
-
-			arrive_time = link[2]['endDate']
+			leave_time = link.data['startDate']
+			self.add_event('leave', leave_time, kwargs)
+			if not link.data.get('recurrence'):
+				# recurring links already depart again, only one off links are moved to the next day
+				self.add_event('expire', leave_time + timedelta(minutes=30), kwargs)
+
+			arrive_time = link.data['endDate']
 			delay = 0
 
 			if self.dynamic:
-				arrive_time, delay = self._delay_arrival(arrive_time)
+				arrive_time, delay = self._delay_arrival(arrive_time, link.data)
 
 			arrive_kwargs = {
 				'tracking_no': kwargs['tracking_no'],
@@ -299,44 +687,40 @@ class Simulator:
 				'delay': delay,
 				'arrive_time': arrive_time,
 			}
-			arrive_event = {
-				'datetime': arrive_time,
-				'desc': f'Arrive node: {to_node}',
-				'actions': self._get_actions('arrive'),
-				'kwargs': arrive_kwargs
-			}
-			if to_node == end_node:
-				self.add_event(
-					{
-						'datetime': arrive_time,
-						'desc': f'Order {tracking_no} delivered to {to_node}',
-						'actions': self._get_actions('deliver'),
-						'kwargs': kwargs
-					}
-				)
-			self.add_event(arrive_event)
+			if link.to_node == end_node:
+				self.add_event('deliver', arrive_time, kwargs)
+			self.add_event('arrive', arrive_time, arrive_kwargs)
 
 		return {'links': links, 'tracking_no': tracking_no}
 
 	def increment_order_count(self, **kwargs):
-		self.handler.increment_order_count(**kwargs)
+		# the load index is updated in memory first, routing only ever reads it from there
+		for link in kwargs['links']:
+			self.load.add(link)
+		with self.stats.timer('db_write'):
+			self.handler.increment_order_count(**kwargs)
 
 	def decrement_order_count(self, **kwargs):
 		# remove order from a timed link
 		# happens when an order is picked up or when updating order counts
-		self.handler.decrement_order_count(**kwargs)
+		self.load.remove(kwargs['link'])
+		with self.stats.timer('db_write'):
+			self.handler.decrement_order_count(**kwargs)
 
 	def reach_node(self, **kwargs):
 		tracking_no = kwargs['tracking_no']
-		orders_dict = self.all_orders[tracking_no]
-		current_node = kwargs['link'][1][0]
-		end_node = orders_dict['links'][0][1][0]
+		orders_dict = self.all_orders.get(tracking_no)
+		if orders_dict is None:
+			# an earlier link delayed past the order's delivery, there is nothing left to re-plan
+			self.stats.count('arrivals.after_delivery')
+			return {'links': [], 'tracking_no': tracking_no}
+		current_node = kwargs['link'].to_node
+		end_node = orders_dict.route.end_node
 
-		current_dict = orders_dict['graph'].nodes[current_node]
-		if current_dict.get('hub_type') and current_dict['hub_type'] == 'JANIO':
+		if current_node in orders_dict.hubs:
 			start_node = current_node
 		else:
-			start_node = next((link[1][0] for link in orders_dict['links'] if link[0][0] == current_node), end_node)
+			start_node = next((link.to_node for link in orders_dict.route.links if link.from_node == current_node), end_node)
 
 		if start_node == end_node:
 			return {'links': [], 'tracking_no': tracking_no}
@@ -345,42 +729,21 @@ class Simulator:
 			'start_label': 'WAREHOUSE',
 			'origin_zone': start_node,
 			'destination_zone': end_node,
-			'payment_type': orders_dict['payment_type'],
-			'agent_app': orders_dict['agent_app'],
+			'payment_type': orders_dict.payment_type,
+			'agent_app': orders_dict.agent_app,
 			'created_on': kwargs['arrive_time']
 		}
-		sub_graph = self.handler.filter_graph(order_details)
-		if not sub_graph:
-			self.results.append(
-				{
-					'tracking_no': tracking_no,
-					'cost_factor': None,
-					'conditions': None,
-					'path': f'No path found: {order_details["origin_zone"]} - {order_details["destination_zone"]}.',
-					'cost': 0
-				}
-			)
+		links, cost = self._replan(orders_dict, current_node, start_node, order_details)
+		if not links:
+			self._add_no_path_result(tracking_no, order_details)
 			return {'links': [], 'tracking_no': tracking_no}
 
-		g = nx.MultiDiGraph()
-		for r in sub_graph.relationships:
-			from_node = r.nodes[0]
-			g.add_node(from_node['name'], label=list(from_node.labels)[0], **from_node._properties)
-			to_node = r.nodes[1]
-			g.add_node(to_node['name'], label=list(to_node.labels)[0], **to_node._properties)
-			g.add_edge(from_node['name'], to_node['name'], attr_dict=r._properties)
-
-		# find the path
-		links, cost = find_path(g, order_details, self.cost_factor)
-		path = f'({end_node})'
-		for link in links:
-			path = f'({link[0][0]}) > [{link[2]["operatedBy"]}] > ' + path
-		self.results.append(
+		self._add_result(
 			{
 				'tracking_no': tracking_no,
 				'cost_factor': self.cost_factor,
 				'conditions': f'Delay by {kwargs["delay"]}hrs',
-				'path': path,
+				'path': self.route_table.intern(links).path,
 				'cost': cost
 			}
 		)
@@ -389,13 +752,101 @@ class Simulator:
 		self.all_orders.pop(kwargs['tracking_no'])
 
 	def run_simulation(self):
-		print('\nBUILDING TIMELINE')
-		for count, order in enumerate(self.orders):
-			print(f'RUNNING ORDER {count+1}/{len(self.orders)}', end='\r')
-			self.add_create_order_event(order)
-
-		self.run_timeline()
-
-		self._output_result()
+		print('\nRUNNING TIMELINE')
+		if self.resume:
+			orders = self._stream_orders(self.orders_file, self._restore_checkpoint())
+		else:
+			self.writer = create_writer(self.output_file, self.sheet_name)
+			orders = self._stream_orders(self.orders_file)
+		if threading.current_thread() is threading.main_thread():
+			signal.signal(signal.SIGINT, self._on_interrupt)
+		profiler = cProfile.Profile() if self.profile else None
+		if profiler:
+			profiler.enable()
+		use_pool = self.workers > 1 and not self.dynamic and not self.congestion
+		if use_pool and self._has_expiring_links():
+			# only the pool is dropped, batch & async routing are still chosen below
+			print('WARNING: -workers ignored, one off links move once taken and workers would route against the graph as loaded, use r')
+			use_pool = False
+		start = time.perf_counter()
+		try:
+			if use_pool:
+				initargs = (self.backend, self.network, self.cost_factor, self.cache.max_size, self.recurrence)
+				with Pool(self.workers, initializer=_init_worker, initargs=initargs) as pool:
+					self.run_timeline(self._route_ahead(orders, pool))
+			elif self.batch_window is not None and not self.dynamic and not self.congestion and self.cost_factor == 'time':
+				self.run_timeline(self._route_waves(orders))
+			elif self.async_io:
+				self.run_timeline(self._prefetch_ahead(orders))
+			else:
+				self.run_timeline(orders)
+		except KeyboardInterrupt:
+			print(f'\nINTERRUPTED: checkpoint saved to {self.checkpointer.path}, continue with -resume')
+			return
+		finally:
+			if threading.current_thread() is threading.main_thread():
+				signal.signal(signal.SIGINT, signal.default_int_handler)
+		if profiler:
+			profiler.disable()
+		self.events_per_second = round(self.timeline.processed / max(time.perf_counter() - start, 1e-9), 1)
+		print(f'\nORDERS READ: {self.orders_read}')
+		if self.skipped_orders:
+			print(f'WARNING: skipped {self.skipped_orders} orders with a malformed created on')
+		print(f'\nEVENTS PROCESSED: {self.timeline.processed}, PENDING: {self.timeline.pending}, {self.events_per_second} events/s')
+		if self.flushes:
+			print(f'DB WRITES: {self.writes} in {self.flushes} transactions')
+		if self.dynamic:
+			replans = self.stats.counters.get('replans.run', 0)
+			skipped = self.stats.counters.get('replans.skipped', 0)
+			print(f'RE-PLANS: {replans}, SKIPPED: {skipped}')
+		load_stats = ', '.join(f'{k}: {v}' for k, v in self.load.stats().items())
+		print(f'LINK LOAD: {load_stats}')
+		if self.reachability is not None:
+			reachability_stats = ', '.join(f'{k}: {v}' for k, v in self.reachability.stats().items())
+			print(f'REACHABILITY: {reachability_stats}')
+		cache_stats = ', '.join(f'{k}: {v}' for k, v in self.cache.stats().items())
+		print(f'SUBGRAPH CACHE: {cache_stats}')
+		route_stats = ', '.join(f'{k}: {v}' for k, v in self.route_table.stats().items())
+		print(f'ROUTES: {route_stats}')
+		print(f'PEAK RSS: {self.peak_rss_mb:.1f} MB')
+
+		with self.stats.timer('output'):
+			self.writer.close()
+		print(f'RESULTS WRITTEN: {self.results_written} to {self.output_file}')
 		self._finish()
+		self.checkpointer.remove()
+		self._report_stats(profiler)
 		print('\nSIMULATION FINISHED')
+
+	@property
+	def peak_rss_mb(self):
+		# ru_maxrss is in kilobytes on linux, the high water mark of the process so far
+		return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+	def _report_stats(self, profiler=None):
+		'''
+		prints the run's timers & counters as json and saves them next to the output file
+		with profiling on, the cProfile stats are saved alongside for pstats / snakeviz
+		'''
+
+		output_stem = os.path.splitext(self.output_file)[0]
+		summary = self.stats.dump(
+			f'{output_stem}.stats.json',
+			orders_read=self.orders_read,
+			events_processed=self.timeline.processed,
+			events_per_second=self.events_per_second,
+			results_written=self.results_written,
+			db_writes=self.writes,
+			db_flushes=self.flushes,
+			cache=self.cache.stats(),
+			load=self.load.stats(),
+			reachability=self.reachability.stats() if self.reachability is not None else None,
+			routes=self.route_table.stats(),
+			peak_rss_mb=round(self.peak_rss_mb, 1),
+			seed=self.delay_model.seed
+		)
+		print(f'\nRUN STATS: {output_stem}.stats.json')
+		print(json.dumps(summary, indent=2, default=str))
+		if profiler:
+			profiler.dump_stats(f'{output_stem}.pstats')
+			print(f'PROFILE: {output_stem}.pstats')
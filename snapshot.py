@@ -0,0 +1,326 @@
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from openpyxl import load_workbook
+
+from graph import base_properties
+from memory_handler import MemoryHandler, link_key
+from parsing import parse_duration, parse_properties
+
+_epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_columns = ['src', 'dst', 'start', 'end', 'start_offset', 'end_offset', 'cost', 'type', 'extra', 'out_indptr', 'in_order', 'in_indptr']
+
+def read_workbook(graph_file, recurrence=None):
+	'''
+	parses the nodes & links sheets of a graph workbook into the records the handlers build graphs from
+	:param recurrence: ISO 8601 duration given to every link without a recurrence of its own
+	:return: nodes, links
+	'''
+
+	workbook = load_workbook(f'{graph_file}.xlsx')
+	nodes = []
+	links = []
+
+	for row in workbook['nodes'].iter_rows(min_row=2, values_only=True):
+		properties = parse_properties(row[2])
+		properties['name'] = row[0]
+		nodes.append({'name': row[0], 'label': row[1], 'properties': properties})
+
+	for row in workbook['links'].iter_rows(min_row=2, values_only=True):
+		# each link is stored once, a recurrence such as P1D repeats its departure during path search
+		properties = parse_properties(row[3])
+		if properties.get('recurrence'):
+			parse_duration(properties['recurrence'])
+		properties['order_count'] = 0
+		links.append({
+			'node1': row[0],
+			'node1_label': row[1],
+			'link': row[2],
+			'node2': row[4],
+			'node2_label': row[5],
+			'properties': properties
+		})
+
+	return apply_recurrence(nodes, links, recurrence)
+
+def apply_recurrence(nodes, links, recurrence=None):
+	'''
+	gives every link without a recurrence of its own the one given, links that change are copied
+	:return: nodes, links
+	'''
+
+	if not recurrence:
+		return nodes, links
+	parse_duration(recurrence)
+	return nodes, [
+		link if link['properties'].get('recurrence') else dict(link, properties=dict(link['properties'], recurrence=recurrence))
+		for link in links
+	]
+
+def snapshot_path(graph_file):
+	return f'{graph_file}.snapshot'
+
+def snapshot_is_fresh(graph_file):
+	# a snapshot older than its workbook is ignored, so an edited workbook is never shadowed
+	meta_file = os.path.join(snapshot_path(graph_file), 'meta.json')
+	if not os.path.exists(meta_file):
+		return False
+	workbook_file = f'{graph_file}.xlsx'
+	return not os.path.exists(workbook_file) or os.path.getmtime(meta_file) >= os.path.getmtime(workbook_file)
+
+def _encode(val):
+	if isinstance(val, datetime):
+		return {'$datetime': val.isoformat()}
+	raise TypeError(f'Cannot store {type(val).__name__} in a snapshot')
+
+def _decode(obj):
+	return datetime.fromisoformat(obj['$datetime']) if '$datetime' in obj else obj
+
+def _microseconds(date):
+	return (date - _epoch) // timedelta(microseconds=1)
+
+def compile_snapshot(nodes, links, path):
+	'''
+	writes a graph as a snapshot directory: node names interned to ids, links grouped by start node in CSR layout,
+	with columnar start, end & cost arrays saved as .npy files, the other link properties are interned in meta.json
+	links are deduplicated the same way MemoryHandler does
+	'''
+
+	node_index = {}
+	node_records = []
+	for node in nodes:
+		if node['name'] not in node_index:
+			node_index[node['name']] = len(node_records)
+			node_records.append({'name': node['name'], 'label': node['label'], 'properties': {}})
+		node_records[node_index[node['name']]]['properties'].update(node['properties'])
+	for link in links:
+		for name, label in [(link['node1'], link['node1_label']), (link['node2'], link['node2_label'])]:
+			if name not in node_index:
+				node_index[name] = len(node_records)
+				node_records.append({'name': name, 'label': label, 'properties': {'name': name}})
+
+	types = {}
+	extras = {}
+	seen = set()
+	rows = []
+	for link in links:
+		properties = link['properties']
+		key = link_key(link['node1'], link['node2'], properties)
+		if key in seen:
+			continue
+		seen.add(key)
+		extra = {k: v for k, v in properties.items() if k not in ['startDate', 'endDate', 'order_count']}
+		extra_key = json.dumps(extra, default=_encode, sort_keys=True)
+		rows.append((
+			node_index[link['node1']],
+			node_index[link['node2']],
+			_microseconds(properties['startDate']),
+			_microseconds(properties['endDate']),
+			int(properties['startDate'].utcoffset().total_seconds()),
+			int(properties['endDate'].utcoffset().total_seconds()),
+			properties['cost'],
+			types.setdefault(link['link'], len(types)),
+			extras.setdefault(extra_key, len(extras))
+		))
+	rows.sort(key=lambda row: row[0])
+
+	n_nodes = len(node_records)
+	columns = dict(zip(_columns[:9], map(list, zip(*rows)))) if rows else {column: [] for column in _columns[:9]}
+	arrays = {
+		'src': np.array(columns['src'], dtype=np.int32),
+		'dst': np.array(columns['dst'], dtype=np.int32),
+		'start': np.array(columns['start'], dtype=np.int64),
+		'end': np.array(columns['end'], dtype=np.int64),
+		'start_offset': np.array(columns['start_offset'], dtype=np.int32),
+		'end_offset': np.array(columns['end_offset'], dtype=np.int32),
+		'cost': np.array(columns['cost'], dtype=np.float64),
+		'type': np.array(columns['type'], dtype=np.int16),
+		'extra': np.array(columns['extra'], dtype=np.int32)
+	}
+	arrays['out_indptr'] = np.searchsorted(arrays['src'], np.arange(n_nodes + 1)).astype(np.int64)
+	arrays['in_order'] = np.argsort(arrays['dst'], kind='stable').astype(np.int32)
+	arrays['in_indptr'] = np.searchsorted(arrays['dst'][arrays['in_order']], np.arange(n_nodes + 1)).astype(np.int64)
+
+	os.makedirs(path, exist_ok=True)
+	for name in _columns:
+		np.save(os.path.join(path, f'{name}.npy'), arrays[name])
+	meta = {
+		'nodes': node_records,
+		'types': list(types),
+		'extras': [json.loads(extra_key) for extra_key in extras]
+	}
+	# meta.json is written last, a snapshot without one is never loaded
+	with open(os.path.join(path, 'meta.json'), 'w') as meta_file:
+		json.dump(meta, meta_file, default=_encode)
+
+class Snapshot:
+	"""
+	a compiled graph, its arrays are memory mapped read only so processes loading the same snapshot share one copy
+	"""
+
+	def __init__(self, path):
+		self.path = path
+		with open(os.path.join(path, 'meta.json')) as meta_file:
+			meta = json.load(meta_file, object_hook=_decode)
+		for name in _columns:
+			setattr(self, name, np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r'))
+		self.nodes = meta['nodes']
+		self.names = [node['name'] for node in self.nodes]
+		self.index = {name: i for i, name in enumerate(self.names)}
+		self.types = meta['types']
+		self.extras = meta['extras']
+		self._timezones = {}
+
+	def __len__(self):
+		return len(self.src)
+
+	def date(self, microseconds, offset):
+		date = _epoch + timedelta(microseconds=microseconds)
+		if not offset:
+			return date
+		tz = self._timezones.get(offset)
+		if tz is None:
+			tz = timezone(timedelta(seconds=offset))
+			self._timezones[offset] = tz
+		return date.astimezone(tz)
+
+	def link(self, link_id, recurrence=None):
+		'''
+		:return: the link as MemoryHandler stores it, with a properties dict of its own
+		'''
+
+		properties = dict(self.extras[self.extra[link_id]])
+		properties['startDate'] = self.date(int(self.start[link_id]), int(self.start_offset[link_id]))
+		properties['endDate'] = self.date(int(self.end[link_id]), int(self.end_offset[link_id]))
+		properties['order_count'] = 0
+		if recurrence and not properties.get('recurrence'):
+			properties['recurrence'] = recurrence
+		return {
+			'from': self.names[self.src[link_id]],
+			'to': self.names[self.dst[link_id]],
+			'type': self.types[self.type[link_id]],
+			'properties': properties
+		}
+
+	def records(self, recurrence=None):
+		# every node & link as the records read_workbook returns, for the neo4j backend
+		labels = [node['label'] for node in self.nodes]
+		links = []
+		for link_id in range(len(self)):
+			link = self.link(link_id, recurrence)
+			links.append({
+				'node1': link['from'],
+				'node1_label': labels[self.src[link_id]],
+				'link': link['type'],
+				'node2': link['to'],
+				'node2_label': labels[self.dst[link_id]],
+				'properties': link['properties']
+			})
+		return [dict(node, properties=dict(node['properties'])) for node in self.nodes], links
+
+class _LazyLinks:
+	# link id -> stored link, built from the snapshot on first access and kept, as writes change it from then on
+
+	def __init__(self, snapshot, recurrence, links=None):
+		self._snapshot = snapshot
+		self._recurrence = recurrence
+		self.materialised = links if links is not None else {}
+
+	def __getitem__(self, link_id):
+		link = self.materialised.get(link_id)
+		if link is None:
+			link = self._snapshot.link(link_id, self._recurrence)
+			self.materialised[link_id] = link
+		return link
+
+	def __len__(self):
+		return len(self._snapshot)
+
+class _Adjacency:
+	# node name -> ids of the links leaving (or entering) it, read from the snapshot's CSR arrays
+
+	def __init__(self, snapshot, indptr, order=None):
+		self._index = snapshot.index
+		self._indptr = indptr
+		self._order = order
+
+	def get(self, name, default=None):
+		i = self._index.get(name)
+		if i is None:
+			return default
+		start, end = int(self._indptr[i]), int(self._indptr[i + 1])
+		if self._order is None:
+			return range(start, end)
+		return self._order[start:end].tolist()
+
+class SnapshotHandler(MemoryHandler):
+	"""
+	MemoryHandler over a memory mapped snapshot, links are only built into dictionaries when a query reaches them
+	building the graph is skipped entirely, as the snapshot already holds it indexed
+	"""
+
+	def __init__(self, path, recurrence=None, links=None):
+		self.path = path
+		self.recurrence = recurrence
+		self._snapshot = Snapshot(path)
+		self._nodes = {
+			node['name']: {'label': node['label'], 'properties': node['properties']} for node in self._snapshot.nodes
+		}
+		self._links = _LazyLinks(self._snapshot, recurrence, links)
+		self._out = _Adjacency(self._snapshot, self._snapshot.out_indptr)
+		self._in = _Adjacency(self._snapshot, self._snapshot.in_indptr, self._snapshot.in_order)
+
+	def __getstate__(self):
+		# the arrays are mapped again on load, only the links built so far are pickled
+		return {'path': self.path, 'recurrence': self.recurrence, 'links': self._links.materialised}
+
+	def __setstate__(self, state):
+		self.__init__(state['path'], state['recurrence'], state['links'])
+
+	def _bundle(self, from_node, to_node):
+		# ids of the links between two nodes
+		start = self._out.get(from_node)
+		to_index = self._snapshot.index.get(to_node)
+		if start is None or to_index is None:
+			return []
+		return [start.start + int(i) for i in np.flatnonzero(self._snapshot.dst[start.start:start.stop] == to_index)]
+
+	def _matching(self, from_node, to_node, properties):
+		key = link_key(from_node, to_node, properties)
+		return [
+			link_id for link_id in self._bundle(from_node, to_node)
+			if link_key(from_node, to_node, self._links[link_id]['properties']) == key
+		]
+
+	def _find_links(self, link):
+		return self._matching(link.from_node, link.to_node, base_properties(link.data))
+
+	def expire_link(self, link):
+		for link_id in self._matching(link.from_node, link.to_node, link.data):
+			properties = self._links[link_id]['properties']
+			properties['startDate'] += timedelta(days=1)
+			properties['endDate'] += timedelta(days=1)
+
+def load_network(graph_file, recurrence=None):
+	'''
+	reads the graph from its snapshot when one is up to date, from the workbook otherwise
+	:return: nodes, links
+	'''
+
+	if snapshot_is_fresh(graph_file):
+		return Snapshot(snapshot_path(graph_file)).records(recurrence)
+	return read_workbook(graph_file, recurrence)
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Compiles a graph workbook into a memory mapped snapshot')
+	parser.add_argument('graph', metavar='graph_file', type=str, help='File name of graph excel file')
+	args = parser.parse_args()
+
+	start = time.time()
+	nodes, links = read_workbook(args.graph)
+	compile_snapshot(nodes, links, snapshot_path(args.graph))
+	print(f'compiled {len(nodes)} nodes, {len(links)} links to {snapshot_path(args.graph)} in {time.time() - start:.2f}s')
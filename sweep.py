@@ -0,0 +1,160 @@
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+import time
+from contextlib import redirect_stdout
+from multiprocessing import Pool
+
+from simulator import Simulator, load_orders
+from snapshot import load_network, snapshot_is_fresh, snapshot_path
+
+# Simulator arguments a grid may vary, every scenario runs on the memory backend in a single process
+sweep_parameters = [
+	'cost_factor', 'algo', 'seed', 'delay_file', 'recurrence', 'congestion', 'incremental', 'batch_window', 'flush_window', 'cache_size'
+]
+default_grid = {'cost_factor': ['time', 'cost'], 'algo': ['STATIC', 'DYNAMIC']}
+kpi_fields = [
+	'scenario', 'orders', 'routed', 'no_path', 'mean_cost', 'replans', 'replans_skipped', 'events', 'events_per_second',
+	'peak_load_ratio', 'departures_overloaded', 'rejected_early', 'runtime_s', 'output', 'error'
+]
+
+_sweep = {}
+
+def _init_sweep(graph_file, orders_file, network, orders):
+	# forked workers inherit the loaded network & orders, each scenario builds its own link state from them
+	_sweep.update(graph_file=graph_file, orders_file=orders_file, network=network, orders=orders)
+
+def scenarios(grid, seed=0):
+	'''
+	expands a grid of parameter lists into one set of Simulator arguments per combination
+	runs are seeded with the sweep's seed unless the grid varies it
+	:return: list of (name, arguments)
+	'''
+
+	unknown = [parameter for parameter in grid if parameter not in sweep_parameters]
+	if unknown:
+		raise ValueError(f'Unsupported sweep parameters: {", ".join(unknown)}, use {", ".join(sweep_parameters)}')
+	names = list(grid)
+	runs = []
+	for i, values in enumerate(itertools.product(*(grid[name] for name in names))):
+		arguments = dict({'seed': seed}, **dict(zip(names, values)))
+		label = '_'.join(f'{name}-{os.path.splitext(os.path.basename(str(val)))[0]}' for name, val in zip(names, values))
+		runs.append((f's{i + 1:02d}_{label}' if label else f's{i + 1:02d}', arguments))
+	return runs
+
+def _result_kpis(output_file):
+	# first routing results only, an order's first row, re-plans in DYNAMIC mode are counted from the run's own counters
+	routed = no_path = 0
+	total_cost = 0
+	seen = set()
+	with open(output_file, newline='') as results:
+		for row in csv.DictReader(results):
+			if row['tracking_no'] in seen:
+				continue
+			seen.add(row['tracking_no'])
+			if row['path'].startswith('No path found'):
+				no_path += 1
+			else:
+				routed += 1
+				total_cost += float(row['cost'])
+	return routed, no_path, total_cost / routed if routed else None
+
+def run_scenario(scenario):
+	'''
+	runs one scenario against the worker's loaded network & orders, its console output is discarded
+	a scenario that fails is reported in its row with the error, the rest of the sweep carries on
+	:return: row of the comparison table
+	'''
+
+	name, arguments, output_dir = scenario
+	output_file = os.path.join(output_dir, f'{name}.csv')
+	if os.path.exists(output_file):
+		os.remove(output_file)
+	start = time.perf_counter()
+	try:
+		with redirect_stdout(io.StringIO()):
+			sim = Simulator(
+				_sweep['graph_file'], _sweep['orders_file'], output_file, backend='MEMORY',
+				network=_sweep['network'], orders=_sweep['orders'], **arguments
+			)
+			sim.run_simulation()
+	except Exception as error:
+		return {
+			'scenario': name,
+			'runtime_s': round(time.perf_counter() - start, 3),
+			'output': output_file,
+			'error': f'{type(error).__name__}: {error}'
+		}
+	runtime = time.perf_counter() - start
+
+	routed, no_path, mean_cost = _result_kpis(output_file)
+	load = sim.load.stats()
+	return {
+		'scenario': name,
+		'orders': sim.orders_read,
+		'routed': routed,
+		'no_path': no_path,
+		'mean_cost': round(mean_cost, 4) if mean_cost is not None else None,
+		'replans': sim.stats.counters.get('replans.run', 0),
+		'replans_skipped': sim.stats.counters.get('replans.skipped', 0),
+		'events': sim.timeline.processed,
+		'events_per_second': sim.events_per_second,
+		'peak_load_ratio': load['peak_load_ratio'],
+		'departures_overloaded': load['departures_overloaded'],
+		'rejected_early': sim.reachability.rejected if sim.reachability is not None else 0,
+		'runtime_s': round(runtime, 3),
+		'output': output_file
+	}
+
+def run_sweep(graph_file, orders_file, grid, output_file, workers=1, seed=0):
+	'''
+	loads the network & orders once and runs every scenario of the grid in a pool of worker processes
+	scenario results go to a directory named after the output file, the table of KPIs to the output file itself
+	:return: rows of the table, in scenario order
+	'''
+
+	runs = scenarios(grid, seed)
+	output_dir = os.path.splitext(output_file)[0]
+	os.makedirs(output_dir, exist_ok=True)
+
+	start = time.perf_counter()
+	# an up to date snapshot is mapped by each scenario instead, so nothing is copied
+	network = snapshot_path(graph_file) if snapshot_is_fresh(graph_file) else load_network(graph_file)
+	orders = load_orders(orders_file)
+	print(f'loaded network & {len(orders[0])} orders in {time.perf_counter() - start:.2f}s, running {len(runs)} scenarios')
+
+	initargs = (graph_file, orders_file, network, orders)
+	with Pool(max(1, min(workers, len(runs))), initializer=_init_sweep, initargs=initargs) as pool:
+		rows = []
+		for row in pool.imap_unordered(run_scenario, [(name, arguments, output_dir) for name, arguments in runs]):
+			print(f'{row["scenario"]}: {row["runtime_s"]}s' + (f', failed with {row["error"]}' if row.get('error') else ''))
+			rows.append(row)
+	order = {name: i for i, (name, _) in enumerate(runs)}
+	rows.sort(key=lambda row: order[row['scenario']])
+
+	with open(output_file, 'w', newline='') as table:
+		writer = csv.DictWriter(table, fieldnames=kpi_fields)
+		writer.writeheader()
+		writer.writerows(rows)
+	print(f'sweep of {len(rows)} scenarios written to {output_file} in {time.perf_counter() - start:.2f}s')
+	return rows
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Runs a grid of simulator configurations over one loaded network')
+	parser.add_argument('graph', metavar='graph_file', type=str, help='File name of graph excel file')
+	parser.add_argument('order', metavar='order_file', type=str, help='File name of order data csv file')
+	parser.add_argument('-grid', metavar='grid_file', type=str, help='Json file of parameter lists, e.g. {"algo": ["STATIC", "DYNAMIC"]}')
+	parser.add_argument('-output', metavar='output_file', type=str, default='sweep.csv', help='File name of the comparison table')
+	parser.add_argument('-workers', metavar='workers', type=int, default=os.cpu_count(), help='Worker processes running scenarios')
+	parser.add_argument('-seed', metavar='seed', type=int, default=0, help='Seed of every scenario, unless the grid varies it')
+	args = parser.parse_args()
+
+	if args.grid:
+		with open(args.grid) as grid_file:
+			sweep_grid = json.load(grid_file)
+	else:
+		sweep_grid = default_grid
+	run_sweep(args.graph, args.order, sweep_grid, args.output, args.workers, args.seed)
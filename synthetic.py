@@ -0,0 +1,112 @@
+import csv
+import random
+from datetime import datetime, timedelta, timezone
+
+from openpyxl import Workbook
+
+from parsing import format_properties
+
+epoch = datetime(2019, 8, 23, tzinfo=timezone.utc)
+merchants = [f'Merchant{i}' for i in range(10)]
+payment_types = ['cod', 'prepaid']
+
+def generate_schedule(n_nodes, n_links, days=1, seed=0):
+	'''
+	builds a random partner network as the node & link records _build_graph produces
+	nodes are split into layers so links mostly flow from pickup coverage areas, through warehouses, to delivery coverage areas
+	each link departs once a day for the number of days given
+	:return: nodes, links, origins, destinations
+	'''
+
+	rng = random.Random(seed)
+	n_layers = max(2, min(8, n_nodes // 10))
+	names = [f'N{i}' for i in range(n_nodes)]
+	layers = [names[i::n_layers] for i in range(n_layers)]
+	nodes = []
+	for i, layer in enumerate(layers):
+		for name in layer:
+			label = 'COVERAGEAREA' if i in [0, n_layers - 1] else 'WAREHOUSE'
+			nodes.append({'name': name, 'label': label, 'properties': {'name': name}})
+	labels = {node['name']: node['label'] for node in nodes}
+
+	links = []
+	for _ in range(n_links):
+		i = rng.randrange(n_layers - 1)
+		from_node = rng.choice(layers[i])
+		to_node = rng.choice(layers[min(n_layers - 1, i + rng.choice([1, 1, 1, 2]))])
+		departure = timedelta(hours=rng.randrange(24), minutes=rng.choice([0, 30]))
+		duration = timedelta(hours=rng.randrange(1, 9))
+		properties = {
+			'cost': rng.randrange(10, 50),
+			'operatedBy': f'Partner{rng.randrange(20)}',
+			'paymentType': rng.choice(['Both', 'Both', 'Both'] + payment_types),
+			'handleableCapacity': rng.choice([100, 500, 1000]),
+			'restrictedMerchants': rng.sample(merchants, rng.choice([0, 0, 0, 1, 2]))
+		}
+		for day in range(days):
+			start = epoch + timedelta(days=day) + departure
+			links.append({
+				'node1': from_node,
+				'node1_label': labels[from_node],
+				'link': 'CONNECTED_TO',
+				'node2': to_node,
+				'node2_label': labels[to_node],
+				'properties': dict(properties, startDate=start, endDate=start + duration, order_count=0)
+			})
+
+	return nodes, links, layers[0], layers[-1]
+
+def generate_orders(n_orders, origins, destinations, days=1, seed=0):
+	'''
+	random orders between the network's coverage areas, created over the first half of the scheduled days
+	so later orders still have departures to take
+	:return: list of order rows, sorted by created on
+	'''
+
+	rng = random.Random(seed)
+	window = max(1, days // 2) * 24 * 3600
+	orders = []
+	for i in range(n_orders):
+		orders.append({
+			'tracking_no': f'SYN{i:07d}',
+			'created_on': epoch + timedelta(seconds=rng.randrange(window), milliseconds=rng.randrange(1000)),
+			'payment_type': rng.choice(payment_types),
+			'origin_zone': rng.choice(origins),
+			'destination_zone': rng.choice(destinations),
+			'agent_application_name': rng.choice(merchants)
+		})
+	orders.sort(key=lambda order: order['created_on'])
+	return orders
+
+def write_graph(graph_file, nodes, links):
+	# writes the records to a workbook laid out like graph.xlsx
+	workbook = Workbook(write_only=True)
+	node_sheet = workbook.create_sheet('nodes')
+	node_sheet.append(['name', 'label', 'attributes'])
+	for node in nodes:
+		properties = {key: val for key, val in node['properties'].items() if key != 'name'}
+		node_sheet.append([node['name'], node['label'], format_properties(properties) or None])
+
+	link_sheet = workbook.create_sheet('links')
+	link_sheet.append(['node1', 'node1_label', 'link', 'attribute', 'node2', 'node2_label'])
+	for link in links:
+		properties = {key: val for key, val in link['properties'].items() if key != 'order_count'}
+		link_sheet.append([
+			link['node1'], link['node1_label'], link['link'], format_properties(properties), link['node2'], link['node2_label']
+		])
+	workbook.save(f'{graph_file}.xlsx')
+
+def write_orders(orders_file, orders):
+	# writes the orders to a csv laid out like orders.csv
+	with open(f'{orders_file}.csv', 'w', newline='') as csv_file:
+		writer = csv.writer(csv_file)
+		writer.writerow(['Tracking No', 'Created On', 'Payment Type', 'Origin Zone', 'Destination Zone', 'Agent Application Name'])
+		for order in orders:
+			writer.writerow([
+				order['tracking_no'],
+				order['created_on'].isoformat(timespec='milliseconds'),
+				order['payment_type'],
+				order['origin_zone'],
+				order['destination_zone'],
+				order['agent_application_name']
+			])
@@ -0,0 +1,47 @@
+import csv
+
+import pytest
+
+from simulator import Simulator
+from synthetic import generate_schedule, generate_orders, write_graph, write_orders
+
+@pytest.fixture(scope='module')
+def network(tmp_path_factory):
+	path = tmp_path_factory.mktemp('network')
+	nodes, links, origins, destinations = generate_schedule(30, 150, days=2, seed=1)
+	write_graph(path / 'graph', nodes, links)
+	write_orders(path / 'orders', generate_orders(60, origins, destinations, days=2, seed=1))
+	return path
+
+def simulate(network, output_file, algo, stop=None, resume=False):
+	sim = Simulator(
+		str(network / 'graph'), str(network / 'orders'), str(output_file), algo=algo, backend='MEMORY',
+		checkpoint_events=37, resume=resume, seed=3
+	)
+	if stop:
+		consume_event = sim.consume_event
+		def interrupting(event):
+			consume_event(event)
+			# as on Ctrl-C, the run stops once the event is consumed
+			if sim.timeline.processed == stop:
+				sim._interrupted = True
+		sim.consume_event = interrupting
+	sim.run_simulation()
+	return sim
+
+def read_results(output_file):
+	# the first column names the run by its start time, so it differs between runs
+	with open(output_file, newline='') as csv_file:
+		return [row[1:] for row in csv.reader(csv_file)]
+
+@pytest.mark.parametrize('algo', ['STATIC', 'DYNAMIC'])
+@pytest.mark.parametrize('stop', [5, 33, 60, 90])
+def test_resume_matches_uninterrupted_run(network, tmp_path, algo, stop):
+	uninterrupted = simulate(network, tmp_path / 'uninterrupted.csv', algo)
+	assert uninterrupted.timeline.processed > stop
+
+	interrupted = simulate(network, tmp_path / 'resumed.csv', algo, stop=stop)
+	assert interrupted.timeline.processed == stop
+	simulate(network, tmp_path / 'resumed.csv', algo, resume=True)
+
+	assert read_results(tmp_path / 'resumed.csv') == read_results(tmp_path / 'uninterrupted.csv')
@@ -0,0 +1,69 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import networkx as nx
+
+from graph import find_path, find_heuristic_cost
+
+start = datetime(2019, 8, 23, tzinfo=timezone.utc)
+
+def build_graph(links):
+	# links as (from, to, departure hours, arrival hours, cost) after start
+	g = nx.MultiDiGraph()
+	for from_node, to_node, departure, arrival, cost in links:
+		for node in [from_node, to_node]:
+			g.add_node(node, label='COVERAGEAREA')
+		g.add_edge(from_node, to_node, attr_dict={
+			'startDate': start + timedelta(hours=departure),
+			'endDate': start + timedelta(hours=arrival),
+			'cost': cost
+		})
+	return g
+
+def brute_force_cost(g, origin, destination):
+	# cheapest total cost over every simple path whose links each depart after the previous one arrives
+	best = None
+	stack = [(origin, start, 0, {origin})]
+	while stack:
+		node, arrival, cost, visited = stack.pop()
+		if node == destination:
+			best = cost if best is None else min(best, cost)
+			continue
+		for nbr, links in g[node].items():
+			if nbr in visited:
+				continue
+			for val in links.values():
+				link_data = val['attr_dict']
+				if link_data['startDate'] > arrival:
+					stack.append((nbr, link_data['endDate'], cost + link_data['cost'], visited | {nbr}))
+	return best
+
+def test_cost_takes_pricier_link_in_time_for_onward_link():
+	g = build_graph([
+		('A', 'B', 1, 10, 1),
+		('A', 'B', 1, 4, 5),
+		('A', 'B', 1, 2, 50),
+		('B', 'C', 6, 8, 1)
+	])
+	links, cost = find_path(g, {'origin_zone': 'A', 'destination_zone': 'C', 'created_on': start}, 'cost')
+	assert cost == 6
+	assert [link.data['cost'] for link in links] == [1, 5]
+
+def test_cost_matches_brute_force():
+	rng = random.Random(0)
+	for _ in range(300):
+		nodes = [f'N{i}' for i in range(6)]
+		links = []
+		for _ in range(rng.randrange(5, 30)):
+			from_node, to_node = rng.sample(nodes, 2)
+			departure = rng.randrange(24)
+			links.append((from_node, to_node, departure, departure + rng.randrange(1, 8), rng.randrange(1, 60)))
+		g = build_graph(links)
+		origin, destination = rng.sample(nodes, 2)
+		order = {'origin_zone': origin, 'destination_zone': destination, 'created_on': start}
+		expected = brute_force_cost(g, origin, destination) if origin in g and destination in g else None
+
+		assert find_path(g, order, 'cost')[1] == expected
+		heuristic = find_heuristic_cost(g, destination, 'cost') if destination in g else None
+		if heuristic is not None:
+			assert find_path(g, order, 'cost', heuristic)[1] == expected
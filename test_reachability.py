@@ -0,0 +1,89 @@
+import random
+from datetime import datetime, timezone
+
+from memory_handler import MemoryHandler
+from reachability import ReachabilityIndex
+
+start = datetime(2019, 8, 23, tzinfo=timezone.utc)
+payment_types = ['cod', 'prepaid', 'other']
+merchants = ['M1', 'M2', 'M3']
+
+def random_link(rng, from_node, to_node, labels):
+	link_type = rng.choice(['CONNECTED_TO'] * 9 + ['OTHER'])
+	properties = {
+		'startDate': start,
+		'endDate': start,
+		# the memory backend keeps one link per end nodes & properties whatever its type, so other links never share a cost
+		'cost': rng.randrange(3) if link_type == 'CONNECTED_TO' else 3,
+		'paymentType': rng.choice(['Both', 'cod', 'prepaid', None])
+	}
+	if properties['paymentType'] is None:
+		del properties['paymentType']
+	# a missing restrictedMerchants never accepts, like the cypher predicate
+	restricted = rng.choice([None, [], [], ['M1'], ['M1', 'M2']])
+	if restricted is not None:
+		properties['restrictedMerchants'] = restricted
+	return {
+		'node1': from_node,
+		'node1_label': labels[from_node],
+		'link': link_type,
+		'node2': to_node,
+		'node2_label': labels[to_node],
+		'properties': properties
+	}
+
+def random_network(rng):
+	# random links, so cycles are common, and a chain whose length is near the 15 hop limit
+	names = [f'N{i}' for i in range(rng.randrange(3, 12))]
+	chain = [f'C{i}' for i in range(rng.randrange(12, 19))]
+	labels = {name: rng.choice(['COVERAGEAREA', 'WAREHOUSE']) for name in names}
+	labels.update({name: 'WAREHOUSE' for name in chain})
+	labels[chain[0]] = labels[chain[-1]] = 'COVERAGEAREA'
+	nodes = [{'name': name, 'label': label, 'properties': {'name': name}} for name, label in labels.items()]
+	links = [random_link(rng, *rng.sample(names, 2), labels) for _ in range(rng.randrange(2, 30))]
+	links += [random_link(rng, from_node, to_node, labels) for from_node, to_node in zip(chain, chain[1:])]
+	return nodes, links, labels
+
+def random_orders(rng, labels, count):
+	names = list(labels)
+	return [
+		{
+			'start_label': rng.choice([None, 'WAREHOUSE']),
+			'origin_zone': rng.choice(names),
+			'destination_zone': rng.choice(names + [None, 'missing']),
+			'payment_type': rng.choice(payment_types),
+			'agent_app': rng.choice(merchants)
+		}
+		for _ in range(count)
+	]
+
+def assert_agrees(index, nodes, links, orders):
+	handler = MemoryHandler()
+	handler.build_graph(nodes, links, clear_graph=True)
+	for order in orders:
+		assert index.reachable(order) == (handler.filter_graph(order) is not None), order
+
+def test_reachable_matches_filter_graph():
+	rng = random.Random(0)
+	for _ in range(200):
+		nodes, links, labels = random_network(rng)
+		assert_agrees(ReachabilityIndex.from_records(nodes, links), nodes, links, random_orders(rng, labels, 40))
+
+def test_reachable_follows_link_updates():
+	rng = random.Random(1)
+	for _ in range(100):
+		nodes, links, labels = random_network(rng)
+		kept = links[:len(links) // 2]
+		index = ReachabilityIndex.from_records(nodes, kept)
+		for link in links[len(links) // 2:]:
+			# queries in between fill the cached searches the updates have to drop
+			assert_agrees(index, nodes, kept, random_orders(rng, labels, 5))
+			if link['link'] == 'CONNECTED_TO':
+				index.add_link(link['node1'], link['node2'], link['properties'])
+			kept.append(link)
+		for link in rng.sample(kept, len(kept) // 3):
+			assert_agrees(index, nodes, kept, random_orders(rng, labels, 5))
+			if link['link'] == 'CONNECTED_TO':
+				index.remove_link(link['node1'], link['node2'], link['properties'])
+			kept.remove(link)
+		assert_agrees(index, nodes, kept, random_orders(rng, labels, 40))
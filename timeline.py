@@ -0,0 +1,38 @@
+import heapq
+
+class Timeline:
+	"""
+	priority queue of simulation events, ordered by event datetime
+	events sharing a datetime are popped newest first, matching the old
+	linear insert where a new event was placed before any event with an equal or later datetime
+	"""
+
+	def __init__(self):
+		self._heap = []
+		self._sequence = 0
+		self.processed = 0
+
+	def __len__(self):
+		return len(self._heap)
+
+	@property
+	def pending(self):
+		return len(self._heap)
+
+	def push(self, event, deferred=False):
+		'''
+		negates the sequence so the most recently added event wins ties
+		deferred events lose ties to every other event, as if they had been queued before the run started
+		'''
+
+		self._sequence += 1
+		heapq.heappush(self._heap, (event.datetime, deferred, -self._sequence, event))
+
+	def peek(self):
+		# datetime of the next event, None when the timeline is empty
+		return self._heap[0][0] if self._heap else None
+
+	def pop(self):
+		event = heapq.heappop(self._heap)[3]
+		self.processed += 1
+		return event